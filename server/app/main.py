@@ -1,24 +1,96 @@
+import asyncio
+import hmac
+import json
 import os
-from fastapi import FastAPI, Request
+import shutil
+from contextlib import asynccontextmanager, nullcontext
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import (
+    FileResponse,
+    JSONResponse,
+    PlainTextResponse,
+    StreamingResponse,
+)
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator
+from app.models.candidate import Candidate, compact
 from app.utils.logger import setup_logger
-from app.utils.videos_processor import process_video
+from app.utils.videos_processor import (
+    ClipCache,
+    process_video,
+    process_video_progressive,
+)
 from app.utils.voiceover_generator import generate_voiceover
 from app.utils.subtitle_generator import generate_subtitle
 from app.utils.keywords_extractor import extract_keywords
-from app.utils.constant import STORAGE_DIR
+from app.utils.cancellation import (
+    CancellationToken,
+    JobCancelled,
+    active_jobs,
+    cancel_job,
+    cancellation_scope,
+    check_cancelled,
+    job_key,
+    register_job,
+    unregister_job,
+)
+from app.utils.checkpoint import load_manifest, run_stage
+from app.utils.constant import (
+    CACHE_DIR,
+    CANCEL_KEY_HEADER,
+    DISCONNECT_POLL_INTERVAL,
+    REQUEST_FILE_NAME,
+    STATUS_FILE_NAME,
+    STORAGE_DIR,
+)
+from app.utils.media_scheduler import media_job, scheduler
+from app.utils.metrics import get_trace, render_prometheus, trace_job
+from app.utils.provider_client import provider_health
+from app.utils.profiler import (
+    PROFILE_DIR_NAME,
+    PROFILE_HEADER,
+    list_profile,
+    profile_job,
+    profiled,
+    should_profile,
+)
+from app.utils.single_flight import SingleFlight
+from app.utils.storage import (
+    create_job_dir,
+    finish_job,
+    new_job_id,
+    start_janitor,
+    storage_stats,
+)
 from app.utils.videos_curator import curate_videos
+from app.utils.warmup import readiness, start_warmup
 from datetime import datetime
+from typing import List, Literal, Optional
 from pathlib import Path
 from dotenv import load_dotenv
 
 load_dotenv(override=True)
 
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 4))
+# Required in the X-Admin-Token header of /admin routes when set. X-Profile
+# is only honoured alongside it, so profiling needs it to be set
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
 logger = setup_logger(__name__)
-app = FastAPI()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    stop_janitor = start_janitor(active_jobs)
+    start_warmup()
+    yield
+    stop_janitor.set()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -28,51 +100,229 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.mount("/storage", StaticFiles(directory="storage"), name="storage")
+class StorageFiles(StaticFiles):
+    # Profiles live in the job dirs but are only served through /admin
+    async def get_response(self, path: str, scope):
+        if PROFILE_DIR_NAME in (part.lower() for part in Path(path).parts):
+            raise HTTPException(status_code=404, detail="Not Found")
+        return await super().get_response(path, scope)
+
+
+app.mount("/storage", StorageFiles(directory="storage"), name="storage")
 
 
-class GenerateRequest(BaseModel):
+class GenerateOptions(BaseModel):
+    subtitle_mode: Literal["burn", "soft", "sidecar"] = "burn"
+    streaming: bool = False
+    aspect_ratios: List[Literal["16:9", "9:16", "1:1"]] = Field(
+        default=["16:9"], min_length=1)
+    priority: Literal["preview", "interactive", "batch"] = "interactive"
+    # "compact" sends field names once plus one row per video, "none" leaves
+    # them out; either way they can be paged from /jobs/{id}/relevant-videos
+    relevant_videos: Literal["full", "compact", "none"] = "full"
+
+    @field_validator("aspect_ratios")
+    @classmethod
+    def unique_aspect_ratios(cls, value: List[str]) -> List[str]:
+        # Each format is written to one file, so a repeat would clobber it
+        if len(set(value)) != len(value):
+            raise ValueError("aspect_ratios must not contain duplicates")
+        return value
+
+
+class GenerateRequest(GenerateOptions):
     text: str
 
 
-@app.post("/generate")
-def generate_video(data: GenerateRequest, request: Request):
-    start_time = datetime.now()
+# Options /generate-progressive can't honour yet, with the only value it
+# accepts for each
+PROGRESSIVE_DEFAULTS = {
+    "subtitle_mode": "burn",
+    "streaming": False,
+    "aspect_ratios": ["16:9"],
+}
 
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_dir = STORAGE_DIR / timestamp
-    output_dir.mkdir(parents=True, exist_ok=True)
 
-    # Video Script
-    text = data.text
+class BatchGenerateRequest(GenerateOptions):
+    scripts: List[str]
+    priority: Literal["preview", "interactive", "batch"] = "batch"
+
+
+def _prepare_assets(
+    text: str,
+    output_dir: Path,
+    search_cache: Optional[SingleFlight] = None
+):
+    job_dir = str(output_dir)
 
     # Generate voiceover dan subtitle
-    voiceover_path, duration = generate_voiceover(text, str(output_dir))
-    subtitle_path = generate_subtitle(
-        str(voiceover_path), text, str(output_dir))
+    voiceover_path, duration = run_stage(
+        job_dir, "tts",
+        lambda: generate_voiceover(text, job_dir),
+        outputs=lambda result: [result[0]],
+        inputs={"text": text})
+    check_cancelled()
+    subtitle_path = run_stage(
+        job_dir, "subtitle",
+        lambda: generate_subtitle(str(voiceover_path), text, job_dir),
+        outputs=lambda path: [path],
+        inputs={"text": text},
+        input_files=[voiceover_path])
+    check_cancelled()
 
     # Extract keywords
-    keywords = extract_keywords(text)
+    keywords = run_stage(
+        job_dir, "keywords",
+        lambda: extract_keywords(text),
+        outputs=lambda _: [],
+        inputs={"text": text},
+        complete=bool)
+    check_cancelled()
 
     # Curate videos
-    relevant_videos = curate_videos(keywords)
+    relevant_videos = run_stage(
+        job_dir, "curation",
+        lambda: curate_videos(keywords, search_cache=search_cache),
+        outputs=lambda _: [],
+        inputs={"keywords": keywords},
+        encode=lambda videos: [v.to_dict() for v in videos],
+        decode=lambda videos: [Candidate(**v) for v in videos],
+        complete=bool)
+    check_cancelled()
+
+    return voiceover_path, subtitle_path, duration, keywords, relevant_videos
+
+
+def _relevant_videos(candidates: List[Candidate], style: str):
+    if style == "compact":
+        return compact(candidates)
+    if style == "none":
+        return None
+    return [candidate.to_dict() for candidate in candidates]
+
+
+def _existing_job_dir(job_id: str) -> Path:
+    job_dir = STORAGE_DIR / job_id
+    if (job_dir.resolve().parent != STORAGE_DIR.resolve()
+            or not job_dir.is_dir()):
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job_dir
+
+
+def _matches(given: Optional[str], expected: str) -> bool:
+    # Constant time, so the secret can't be guessed from response timings
+    return hmac.compare_digest(
+        (given or "").encode("utf-8"), expected.encode("utf-8"))
+
+
+def _is_admin(request: Request) -> bool:
+    # Without a configured token nobody is an admin
+    return bool(ADMIN_TOKEN) and _matches(
+        request.headers.get("X-Admin-Token"), ADMIN_TOKEN)
+
+
+def _profile_header(request: Request) -> Optional[str]:
+    # Profiling traces the whole process, so clients can't switch it on
+    if _is_admin(request):
+        return request.headers.get(PROFILE_HEADER)
+    return None
+
+
+def _write_status(output_dir: Path, status: str, error: Optional[str] = None):
+    # Polled by clients of background jobs, so never half-written
+    status_path = output_dir / STATUS_FILE_NAME
+    temp_path = status_path.with_suffix(".tmp")
+    temp_path.write_text(json.dumps({"status": status, "error": error}))
+    os.replace(temp_path, status_path)
+
+
+async def _cancel_on_disconnect(request: Request, token: CancellationToken):
+    while not token.cancelled:
+        if await request.is_disconnected():
+            token.cancel("client disconnected")
+            return
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+
+def _render_progressive(
+    text: str,
+    output_dir: Path,
+    priority: str,
+    token: CancellationToken,
+    profile: bool = False
+):
+    start_time = datetime.now()
+
+    try:
+        with cancellation_scope(token), \
+                trace_job(output_dir.name, output_dir) as root, \
+                (profile_job(output_dir, root) if profile else nullcontext()):
+            voiceover_path, subtitle_path, duration, _, relevant_videos = (
+                _prepare_assets(text, output_dir))
+            with media_job(output_dir.name, priority):
+                process_video_progressive(
+                    relevant_videos,
+                    str(output_dir),
+                    str(voiceover_path),
+                    str(subtitle_path),
+                    duration
+                )
+    except JobCancelled as e:
+        shutil.rmtree(output_dir, ignore_errors=True)
+        logger.info(f"Progressive render in {output_dir} cancelled: {e}")
+        return
+    except Exception as e:
+        logger.error(f"Progressive render in {output_dir} failed: {e}")
+        _write_status(output_dir, "failed", str(e))
+        return
+    finally:
+        unregister_job(output_dir.name)
+
+    _write_status(output_dir, "completed")
+    finish_job(output_dir)
+    logger.info(f"Video streamed in {datetime.now() - start_time}")
+
+
+def _generate(
+    data: GenerateRequest,
+    job_id: str,
+    output_dir: Path,
+    base_url: str,
+    search_cache: Optional[SingleFlight] = None,
+    clip_cache: Optional[ClipCache] = None
+):
+    start_time = datetime.now()
+
+    # Video Script
+    text = data.text
+
+    voiceover_path, subtitle_path, duration, keywords, relevant_videos = (
+        _prepare_assets(text, output_dir, search_cache))
 
     # Process video
-    output_path, clips = process_video(
-        relevant_videos,
-        str(output_dir),
-        str(voiceover_path),
-        str(subtitle_path),
-        duration
-    )
+    with media_job(job_id, data.priority):
+        output_paths, clips = process_video(
+            relevant_videos,
+            str(output_dir),
+            str(voiceover_path),
+            str(subtitle_path),
+            duration,
+            subtitle_mode=data.subtitle_mode,
+            streaming=data.streaming,
+            aspect_ratios=data.aspect_ratios,
+            clip_cache=clip_cache
+        )
+    output_path = output_paths[data.aspect_ratios[0]]
 
     # Generate URLs
-    base_url = str(request.base_url).rstrip("/")
-    storage_url = f"{base_url}/storage/{timestamp}"
+    storage_url = f"{base_url}/storage/{job_id}"
     voiceover_url = f"{storage_url}/{Path(voiceover_path).name}"
     subtitle_url = f"{storage_url}/{Path(subtitle_path).name}"
+    vtt_path = Path(subtitle_path).with_suffix(".vtt")
     video_url = f"{storage_url}/{Path(output_path).name}"
 
+    finish_job(output_dir)
+
     end_time = datetime.now()
     execution_time = (end_time - start_time).total_seconds()
     logger.info(f"Video generated in {end_time - start_time}")
@@ -88,6 +338,11 @@ def generate_video(data: GenerateRequest, request: Request):
             "subtitle": {
                 "name": Path(subtitle_path).name,
                 "url": subtitle_url,
+                "mode": data.subtitle_mode,
+                "vtt_url": (
+                    f"{storage_url}/{vtt_path.name}"
+                    if data.subtitle_mode == "sidecar" else None
+                ),
             },
             "video": {
                 "name": Path(output_path).name,
@@ -98,14 +353,360 @@ def generate_video(data: GenerateRequest, request: Request):
                         "url": f"{storage_url}/{Path(clip).name}"
                     }
                     for clip in clips
-                ]
+                ],
+                "playlist_url": (
+                    f"{storage_url}/hls/master.m3u8"
+                    if data.streaming else None
+                ),
             },
+            "videos": [
+                {
+                    "aspect_ratio": aspect_ratio,
+                    "name": Path(path).name,
+                    "url": f"{storage_url}/{Path(path).name}"
+                }
+                for aspect_ratio, path in output_paths.items()
+            ],
         },
         "keywords": keywords,
-        "relevant_videos": relevant_videos,
+        "relevant_videos": _relevant_videos(
+            relevant_videos, data.relevant_videos),
+        "relevant_videos_total": len(relevant_videos),
+        "relevant_videos_url": f"{base_url}/jobs/{job_id}/relevant-videos",
     }
 
 
+async def _run_generation(
+    data: GenerateRequest,
+    request: Request,
+    job_id: str,
+    output_dir: Path,
+    resumed: bool = False
+):
+    base_url = str(request.base_url).rstrip("/")
+    profile = should_profile(_profile_header(request))
+    token = register_job(job_id)
+    watcher = asyncio.create_task(_cancel_on_disconnect(request, token))
+
+    try:
+        # The worker thread inherits this context, and with it the token
+        with cancellation_scope(token), trace_job(job_id, output_dir) as root:
+            if profile:
+                return await run_in_threadpool(
+                    profiled, output_dir, root,
+                    _generate, data, job_id, output_dir, base_url)
+            return await run_in_threadpool(
+                _generate, data, job_id, output_dir, base_url)
+    except JobCancelled as e:
+        # A resumed job keeps its checkpoints for the next attempt
+        if not resumed:
+            shutil.rmtree(output_dir, ignore_errors=True)
+        logger.info(f"Video generation {job_id} cancelled: {e}")
+        return JSONResponse(
+            status_code=499,
+            content={
+                "message": "Video generation cancelled.",
+                "reason": str(e),
+            },
+        )
+    finally:
+        watcher.cancel()
+        unregister_job(job_id)
+
+
+@app.post("/generate")
+async def generate_video(data: GenerateRequest, request: Request):
+    output_dir = create_job_dir()
+    job_id = output_dir.name
+
+    # Kept so a failed or interrupted job can be resumed later
+    (output_dir / REQUEST_FILE_NAME).write_text(data.model_dump_json())
+
+    return await _run_generation(data, request, job_id, output_dir)
+
+
+@app.post("/generate-batch")
+async def generate_batch(data: BatchGenerateRequest, request: Request):
+    base_url = str(request.base_url).rstrip("/")
+    options = data.model_dump(exclude={"scripts"})
+    profile_header = _profile_header(request)
+
+    # Shared by every script in the batch
+    batch_id = f"batch_{new_job_id()}"
+    batch_token = CancellationToken()
+    search_cache = SingleFlight("search")
+    cache_dir = CACHE_DIR / batch_id
+    clip_cache = ClipCache(str(cache_dir))
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def run_item(index: int, text: str):
+        async with semaphore:
+            item = GenerateRequest(text=text, **options)
+            output_dir = create_job_dir()
+            job_id = output_dir.name
+            (output_dir / REQUEST_FILE_NAME).write_text(
+                item.model_dump_json())
+
+            token = register_job(job_id)
+            try:
+                with batch_token.on_cancel(
+                        lambda: token.cancel(batch_token.reason)):
+                    with cancellation_scope(token), \
+                            trace_job(job_id, output_dir) as root:
+                        args = (_generate, item, job_id, output_dir,
+                                base_url, search_cache, clip_cache)
+                        if should_profile(profile_header):
+                            args = (profiled, output_dir, root) + args
+                        result = await run_in_threadpool(*args)
+                return {"index": index, "job_id": job_id,
+                        "status": "completed", "result": result}
+            except JobCancelled as e:
+                shutil.rmtree(output_dir, ignore_errors=True)
+                return {"index": index, "job_id": job_id,
+                        "status": "cancelled", "error": str(e)}
+            except Exception as e:
+                logger.error(f"Batch item {index} ({job_id}) failed: {e}")
+                return {"index": index, "job_id": job_id,
+                        "status": "failed", "error": str(e)}
+            finally:
+                unregister_job(job_id)
+
+    async def stream_results():
+        # Registered like a job, so the storage janitor leaves the batch's
+        # cache alone while it runs
+        register_job(batch_id, batch_token)
+        watcher = asyncio.create_task(
+            _cancel_on_disconnect(request, batch_token))
+        tasks = [
+            asyncio.create_task(run_item(i, text))
+            for i, text in enumerate(data.scripts)
+        ]
+        try:
+            # One JSON line per script, in completion order
+            for next_item in asyncio.as_completed(tasks):
+                item = await next_item
+                yield json.dumps(jsonable_encoder(item)) + "\n"
+        finally:
+            if not all(task.done() for task in tasks):
+                batch_token.cancel("batch stream closed")
+            watcher.cancel()
+
+            def cleanup(_):
+                shutil.rmtree(cache_dir, ignore_errors=True)
+                unregister_job(batch_id)
+                logger.info(
+                    f"Batch of {len(tasks)} finished, search cache "
+                    f"{search_cache.hits} hits / {search_cache.misses} misses")
+
+            # The cache goes once every item has stopped using it, even when
+            # a client disconnect cancels this wait
+            items = asyncio.gather(*tasks, return_exceptions=True)
+            items.add_done_callback(cleanup)
+            await asyncio.shield(items)
+
+    return StreamingResponse(
+        stream_results(), media_type="application/x-ndjson")
+
+
+@app.post("/jobs/{job_id}/resume")
+async def resume_generation(job_id: str, request: Request):
+    output_dir = _existing_job_dir(job_id)
+    request_path = output_dir / REQUEST_FILE_NAME
+    if not request_path.exists():
+        raise HTTPException(status_code=404, detail="Job not found.")
+    if job_id in active_jobs():
+        raise HTTPException(status_code=409, detail="Job is still running.")
+
+    data = GenerateRequest.model_validate_json(request_path.read_text())
+    return await _run_generation(
+        data, request, job_id, output_dir, resumed=True)
+
+
+@app.post("/generate-progressive")
+def generate_video_progressive(
+    data: GenerateRequest,
+    request: Request,
+    background_tasks: BackgroundTasks
+):
+    # Segments are always 16:9 with burned-in subtitles
+    unsupported = [
+        name for name, default in PROGRESSIVE_DEFAULTS.items()
+        if getattr(data, name) != default
+    ]
+    if unsupported:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Not supported by progressive rendering: "
+                   f"{', '.join(unsupported)}.")
+
+    output_dir = create_job_dir()
+    job_id = output_dir.name
+    _write_status(output_dir, "running")
+
+    # The playlist grows while segments render; players poll it until
+    # #EXT-X-ENDLIST appears, and the job status tells why it ended
+    token = register_job(job_id)
+    background_tasks.add_task(
+        _render_progressive, data.text, output_dir, data.priority, token,
+        should_profile(_profile_header(request)))
+
+    base_url = str(request.base_url).rstrip("/")
+    storage_url = f"{base_url}/storage/{job_id}"
+
+    return {
+        "message": "Video generation started.",
+        "job_id": job_id,
+        "status_url": f"{base_url}/jobs/{job_id}/status",
+        # Only this response carries the key; send it back as
+        # X-Cancel-Key to stop the job
+        "cancel_url": f"{base_url}/jobs/{job_id}/cancel",
+        "cancel_key": token.key,
+        "result": {
+            "playlist": {
+                "name": "live.m3u8",
+                "url": f"{storage_url}/live.m3u8",
+            },
+            "video": {
+                "name": "output.mp4",
+                "url": f"{storage_url}/output.mp4",
+            },
+        },
+    }
+
+
+@app.post("/jobs/{job_id}/cancel")
+def cancel_generation(job_id: str, request: Request):
+    # Synchronous jobs are cancelled by disconnecting; background ones by
+    # the caller holding their cancel key, or by an admin. Anyone else gets
+    # the same 404 as for an unknown job
+    key = job_key(job_id)
+    if key is None or not (
+            _is_admin(request)
+            or _matches(request.headers.get(CANCEL_KEY_HEADER), key)):
+        raise HTTPException(status_code=404, detail="Job not found.")
+    if not cancel_job(job_id):
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return {"message": "Cancellation requested.", "job_id": job_id}
+
+
+@app.get("/jobs/{job_id}/status")
+def job_status(job_id: str):
+    status_path = _existing_job_dir(job_id) / STATUS_FILE_NAME
+    if status_path.exists():
+        return {"job_id": job_id, **json.loads(status_path.read_text())}
+    if job_id in active_jobs():
+        return {"job_id": job_id, "status": "running", "error": None}
+    raise HTTPException(status_code=404, detail="Status not found.")
+
+
+@app.get("/jobs/{job_id}/relevant-videos")
+def job_relevant_videos(
+    job_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+    style: Literal["full", "compact"] = "full"
+):
+    curation = load_manifest(
+        str(_existing_job_dir(job_id)))["stages"].get("curation")
+    if curation is None:
+        raise HTTPException(status_code=404, detail="Curation not found.")
+
+    rows = curation["result"]
+    page = [Candidate(**row) for row in rows[offset:offset + limit]]
+    return {
+        "job_id": job_id,
+        "total": len(rows),
+        "offset": offset,
+        "limit": limit,
+        "relevant_videos": _relevant_videos(page, style),
+    }
+
+
+@app.get("/jobs/{job_id}/trace")
+def job_trace(job_id: str):
+    trace = get_trace(job_id, _existing_job_dir(job_id))
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found.")
+    return trace
+
+
+def _require_admin(request: Request):
+    # Admin endpoints don't exist until a token is configured
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not _is_admin(request):
+        raise HTTPException(status_code=403, detail="Forbidden.")
+
+
+@app.get("/admin/jobs")
+def list_jobs(request: Request):
+    _require_admin(request)
+    return {"jobs": active_jobs()}
+
+
+@app.get("/admin/jobs/{job_id}/profile")
+def job_profile(job_id: str, request: Request):
+    _require_admin(request)
+    files = list_profile(_existing_job_dir(job_id))
+    if not files:
+        raise HTTPException(status_code=404, detail="Profile not found.")
+
+    base_url = str(request.base_url).rstrip("/")
+    return {
+        "job_id": job_id,
+        "files": [
+            {
+                "name": name,
+                "url": f"{base_url}/admin/jobs/{job_id}/profile/{name}"
+            }
+            for name in files
+        ],
+    }
+
+
+@app.get("/admin/jobs/{job_id}/profile/{name}")
+def download_job_profile(job_id: str, name: str, request: Request):
+    _require_admin(request)
+    job_dir = _existing_job_dir(job_id)
+    if name not in list_profile(job_dir):
+        raise HTTPException(status_code=404, detail="Profile not found.")
+    return FileResponse(
+        job_dir / PROFILE_DIR_NAME / name, filename=f"{job_id}_{name}")
+
+
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+def readyz():
+    status = readiness()
+    return JSONResponse(status_code=200 if status["ready"] else 503,
+                        content=status)
+
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(
+        render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/stats/storage")
+def storage_usage():
+    return storage_stats()
+
+
+@app.get("/stats/scheduler")
+def scheduler_stats():
+    return scheduler.stats()
+
+
+@app.get("/stats/providers")
+def provider_stats():
+    return provider_health()
+
+
 @app.post("/generate-dummy")
 def generate_video_dummy(data: GenerateRequest, request: Request):
     return {
@@ -0,0 +1,59 @@
+from typing import Any, Dict, List, Optional
+from app.models.video import Video
+
+CANDIDATE_FIELDS = (
+    "source",
+    "keyword",
+    "description",
+    "url",
+    "duration",
+    "width",
+    "height",
+    "thumbnail",
+    "similarity_score",
+)
+
+
+class Candidate:
+    # Unvalidated search hit; cheap to build in bulk. Only clips that are
+    # actually used get promoted to a full Video
+    __slots__ = CANDIDATE_FIELDS
+
+    def __init__(
+        self,
+        source: str,
+        keyword: str,
+        description: Optional[str],
+        url: str,
+        duration: Optional[float],
+        width: Optional[float],
+        height: Optional[float],
+        thumbnail: Optional[str],
+        similarity_score: Optional[float]
+    ):
+        self.source = source
+        self.keyword = keyword
+        self.description = description
+        self.url = url
+        self.duration = duration
+        self.width = width
+        self.height = height
+        self.thumbnail = thumbnail
+        self.similarity_score = similarity_score
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in CANDIDATE_FIELDS}
+
+    def to_row(self) -> List[Any]:
+        return [getattr(self, field) for field in CANDIDATE_FIELDS]
+
+    def to_video(self) -> Video:
+        return Video(**self.to_dict())
+
+
+def compact(candidates: List[Candidate]) -> Dict[str, Any]:
+    # Column names once, then one plain list per candidate
+    return {
+        "fields": list(CANDIDATE_FIELDS),
+        "rows": [candidate.to_row() for candidate in candidates],
+    }
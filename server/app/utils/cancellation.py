@@ -0,0 +1,122 @@
+import itertools
+import secrets
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class CancellationToken:
+    def __init__(self):
+        self.reason: Optional[str] = None
+        # Proves a caller started the job, so only it can cancel the job
+        self.key = secrets.token_urlsafe(16)
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: Dict[int, Callable[[], None]] = {}
+        self._handles = itertools.count()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled"):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks = list(self._callbacks.values())
+
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def check(self):
+        if self._event.is_set():
+            raise JobCancelled(self.reason)
+
+    def sleep(self, seconds: float):
+        # Like time.sleep, but wakes up as soon as the job is cancelled
+        if self._event.wait(seconds):
+            raise JobCancelled(self.reason)
+
+    @contextmanager
+    def on_cancel(self, callback: Callable[[], None]):
+        with self._lock:
+            handle = next(self._handles)
+            self._callbacks[handle] = callback
+            already_cancelled = self._event.is_set()
+
+        if already_cancelled:
+            callback()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._callbacks.pop(handle, None)
+
+
+_token: ContextVar[CancellationToken] = ContextVar(
+    "cancellation_token", default=CancellationToken())
+
+_jobs: Dict[str, CancellationToken] = {}
+_jobs_lock = threading.Lock()
+
+
+@contextmanager
+def cancellation_scope(token: CancellationToken):
+    reset_token = _token.set(token)
+    try:
+        yield token
+    finally:
+        _token.reset(reset_token)
+
+
+def current_token() -> CancellationToken:
+    return _token.get()
+
+
+def check_cancelled():
+    _token.get().check()
+
+
+def register_job(
+    job_id: str,
+    token: Optional[CancellationToken] = None
+) -> CancellationToken:
+    token = token or CancellationToken()
+    with _jobs_lock:
+        _jobs[job_id] = token
+    return token
+
+
+def unregister_job(job_id: str):
+    with _jobs_lock:
+        _jobs.pop(job_id, None)
+
+
+def cancel_job(job_id: str, reason: str = "cancel requested") -> bool:
+    with _jobs_lock:
+        token = _jobs.get(job_id)
+    if token is None:
+        return False
+    token.cancel(reason)
+    return True
+
+
+def job_key(job_id: str) -> Optional[str]:
+    with _jobs_lock:
+        token = _jobs.get(job_id)
+    return token.key if token else None
+
+
+def active_jobs() -> List[str]:
+    with _jobs_lock:
+        return list(_jobs)
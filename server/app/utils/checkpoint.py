@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+from app.utils.logger import setup_logger
+from app.utils.metrics import CACHE_HITS, CACHE_MISSES, count
+
+logger = setup_logger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+
+_manifest_lock = threading.Lock()
+
+
+def _fingerprint(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return {"path": str(path), "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns}
+
+
+def _hash_inputs(inputs: Dict[str, Any], input_files: List[str]) -> str:
+    payload = {
+        "inputs": inputs,
+        "files": [_fingerprint(path) for path in input_files],
+    }
+    encoded = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def _outputs_valid(outputs: List[Dict[str, Any]]) -> bool:
+    return all(
+        _fingerprint(output["path"]) == output for output in outputs
+    )
+
+
+def load_manifest(job_dir: str) -> Dict[str, Any]:
+    manifest_path = Path(job_dir) / MANIFEST_NAME
+    if not manifest_path.exists():
+        return {"stages": {}}
+    try:
+        return json.loads(manifest_path.read_text())
+    except ValueError:
+        logger.warning(f"Ignoring unreadable manifest in {job_dir}")
+        return {"stages": {}}
+
+
+def _record_stage(job_dir: str, name: str, entry: Dict[str, Any]):
+    manifest_path = Path(job_dir) / MANIFEST_NAME
+    with _manifest_lock:
+        manifest = load_manifest(job_dir)
+        manifest["stages"][name] = entry
+
+        temp_path = manifest_path.with_suffix(".tmp")
+        temp_path.write_text(json.dumps(manifest, indent=2, default=str))
+        os.replace(temp_path, manifest_path)
+
+
+def run_stage(
+    job_dir: str,
+    name: str,
+    func: Callable[[], Any],
+    outputs: Callable[[Any], List[str]],
+    inputs: Optional[Dict[str, Any]] = None,
+    input_files: Optional[List[str]] = None,
+    encode: Callable[[Any], Any] = lambda result: result,
+    decode: Callable[[Any], Any] = lambda result: result,
+    complete: Callable[[Any], bool] = lambda result: True
+) -> Any:
+    inputs_hash = _hash_inputs(inputs or {}, input_files or [])
+
+    entry = load_manifest(job_dir)["stages"].get(name)
+    if (entry and entry["inputs_hash"] == inputs_hash
+            and _outputs_valid(entry["outputs"])):
+        logger.info(f"[{Path(job_dir).name}] Reusing stage '{name}'")
+        CACHE_HITS.inc(cache="checkpoint", stage=name)
+        count("checkpoint_hits")
+        return decode(entry["result"])
+
+    CACHE_MISSES.inc(cache="checkpoint", stage=name)
+    started_at = datetime.now()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+
+    # A degraded result (e.g. a provider outage) is used for this run only,
+    # so a retry gets another chance at the full one
+    if not complete(result):
+        logger.warning(
+            f"[{Path(job_dir).name}] Stage '{name}' incomplete, not saved")
+        return result
+
+    _record_stage(job_dir, name, {
+        "inputs_hash": inputs_hash,
+        "outputs": [
+            fingerprint for fingerprint in map(_fingerprint, outputs(result))
+            if fingerprint
+        ],
+        "result": encode(result),
+        "started_at": started_at.isoformat(),
+        "elapsed": elapsed,
+    })
+
+    return result
@@ -11,3 +11,9 @@ TTS_CONFIG_PATH = BASE_DIR / "tts/config.json"
 TTS_SPEAKERS_PATH = BASE_DIR / "tts/speakers.pth"
 
 STORAGE_DIR = BASE_DIR / "storage"
+REQUEST_FILE_NAME = "request.json"
+STATUS_FILE_NAME = "status.json"
+CACHE_DIR = STORAGE_DIR / "cache"
+
+CANCEL_KEY_HEADER = "X-Cancel-Key"
+DISCONNECT_POLL_INTERVAL = 1.0  # seconds
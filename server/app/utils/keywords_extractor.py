@@ -1,15 +1,171 @@
 import os
-import google.generativeai as genai
+import re
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from contextvars import copy_context
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional
+from app.utils.logger import setup_logger
+from app.utils.metrics import annotate, traced
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-genai.configure(api_key=GEMINI_API_KEY)
+logger = setup_logger(__name__)
 
+DEFAULT_BACKEND = "gemini-with-local-fallback"
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "8"))
+GEMINI_WORKERS = int(os.getenv("GEMINI_WORKERS", 4))
 
-def extract_keywords(text: str, max_keywords: int = 3) -> list[str]:
-    model = genai.GenerativeModel(
+# Calls that outlive GEMINI_TIMEOUT finish here instead of on a new thread
+# per request
+_gemini_pool = ThreadPoolExecutor(max_workers=GEMINI_WORKERS,
+                                  thread_name_prefix="gemini")
+
+STOPWORDS = {
+    "ada", "adalah", "agar", "akan", "aku", "anda", "antara", "apa", "apabila",
+    "atas", "atau", "bagai", "bagaimana", "bagi", "bahkan", "bahwa", "banyak",
+    "beberapa", "begitu", "belum", "benar", "berapa", "bersama", "biasa",
+    "bila", "bisa", "boleh", "bukan", "cukup", "dalam", "dan", "dapat", "dari",
+    "demikian", "dengan", "di", "dia", "diri", "dulu", "hal", "hanya",
+    "harus", "hingga", "ia", "ialah", "ini", "itu", "jadi", "jika", "juga",
+    "kala", "kalau", "kami", "kamu", "karena", "ke", "kecil", "kembali",
+    "kemudian", "kepada", "kini", "kita", "lagi", "lain", "lalu", "lebih",
+    "maka", "masih", "masing", "mau", "melalui", "memang", "menjadi",
+    "mereka", "merupakan", "meski", "mungkin", "namun", "nya", "oleh", "pada",
+    "para", "pasti", "perlu", "pula", "pun", "saat", "saja", "sama", "sambil",
+    "sampai", "sangat", "satu", "saya", "se", "sebab", "sebagai", "sebelum",
+    "sebuah", "sedang", "sedangkan", "sehingga", "sekali", "sekarang",
+    "selalu", "selama", "semua", "seperti", "serta", "sesuatu", "setelah",
+    "setiap", "sini", "situ", "suatu", "sudah", "supaya", "tak", "tanpa",
+    "tapi", "telah", "tentang", "tentu", "terhadap", "tersebut", "tetapi",
+    "tidak", "tiap", "untuk", "yaitu", "yakni", "yang",
+}
+
+VISUAL_TERMS = {
+    "air": "water", "air terjun": "waterfall", "alam": "nature",
+    "anak": "child", "angin": "wind", "api": "fire", "awan": "clouds",
+    "bandara": "airport", "bangunan": "building", "bawah laut": "underwater",
+    "bayi": "baby", "belajar": "studying", "benih": "seeds", "bintang": "stars",
+    "bukit": "hills", "bulan": "moon", "bunga": "flowers", "burung": "birds",
+    "danau": "lake", "daun": "leaves", "desa": "village", "dokter": "doctor",
+    "gedung": "building", "gelap": "dark", "gunung": "mountain",
+    "guru": "teacher", "hewan": "animals", "hijau": "green", "hujan": "rain",
+    "hutan": "forest", "ikan": "fish", "jalan": "road", "jembatan": "bridge",
+    "kantor": "office", "kapal": "ship", "keluarga": "family",
+    "kebun": "garden", "kereta": "train", "kopi": "coffee", "kota": "city",
+    "langit": "sky", "laut": "sea", "makanan": "food", "malam": "night",
+    "matahari": "sun", "matahari terbenam": "sunset",
+    "matahari terbit": "sunrise", "mobil": "car", "orang": "people",
+    "padi": "rice", "pagi": "morning", "pantai": "beach", "pasar": "market",
+    "pegunungan": "mountains", "pemandangan": "landscape", "perahu": "boat",
+    "perkotaan": "urban", "pesawat": "airplane", "petani": "farmer",
+    "pohon": "trees", "pulau": "island", "rumah": "house", "salju": "snow",
+    "sawah": "rice fields", "sekolah": "school", "sungai": "river",
+    "taman": "park", "tanaman": "plants", "tenang": "calm",
+    "teknologi": "technology", "air laut": "seawater", "ombak": "waves",
+    "olahraga": "sports", "komputer": "computer", "lalu lintas": "traffic",
+    "pedesaan": "countryside", "indah": "beautiful", "sejuk": "fresh",
+    "hangat": "warm", "dingin": "cold", "senja": "dusk", "kabut": "fog",
+    "batu": "rocks", "pasir": "sand", "rumput": "grass", "kucing": "cat",
+    "anjing": "dog", "sapi": "cow", "kuda": "horse", "musik": "music",
+    "tari": "dance", "masak": "cooking", "dapur": "kitchen",
+}
+
+
+def _join_terms(words: List[str]) -> List[str]:
+    # Keep two-word terms such as "lalu lintas" together, before their
+    # first word gets dropped as a stopword
+    joined = []
+    i = 0
+    while i < len(words):
+        pair = " ".join(words[i:i + 2])
+        if i + 1 < len(words) and pair in VISUAL_TERMS:
+            joined.append(pair)
+            i += 2
+        else:
+            joined.append(words[i])
+            i += 1
+    return joined
+
+
+def _split_phrases(text: str) -> List[List[str]]:
+    phrases = []
+    for fragment in re.split(r"[.,;:!?()\"\n]+", text.lower()):
+        current = []
+        for word in _join_terms(re.findall(r"[a-z]+", fragment)):
+            if word in STOPWORDS or len(word) < 3:
+                if current:
+                    phrases.append(current)
+                current = []
+            else:
+                current.append(word)
+        if current:
+            phrases.append(current)
+    return phrases
+
+
+def _translate(words: List[str]) -> List[str]:
+    return [VISUAL_TERMS[word] for word in words if word in VISUAL_TERMS]
+
+
+@traced("keywords.local")
+def _local(text: str, max_keywords: int) -> list[str]:
+    phrases = _split_phrases(text)
+
+    # RAKE scoring: word score = degree / frequency, phrase = sum of words
+    frequency = defaultdict(int)
+    degree = defaultdict(int)
+    for phrase in phrases:
+        for word in phrase:
+            frequency[word] += 1
+            degree[word] += len(phrase)
+
+    scored = []
+    for phrase in phrases:
+        score = sum(degree[w] / frequency[w] for w in phrase)
+        terms = _translate(phrase)
+        # Phrases with visual terms are the ones useful for stock search
+        scored.append((score * (1 + len(terms)), terms, phrase))
+
+    scored.sort(key=lambda s: -s[0])
+
+    keywords = []
+    for _, terms, _ in scored:
+        keyword = " ".join(dict.fromkeys(terms))
+        if keyword and keyword not in keywords:
+            keywords.append(keyword)
+        if len(keywords) >= max_keywords:
+            break
+
+    # Nothing matched the dictionary; the best untranslated phrases still
+    # beat searching for nothing
+    if not keywords:
+        for _, _, phrase in scored[:max_keywords]:
+            keyword = " ".join(phrase)
+            if keyword not in keywords:
+                keywords.append(keyword)
+
+    return keywords
+
+
+@lru_cache(maxsize=1)
+def _load_gemini():
+    # Imported and configured on first use, after .env has been loaded
+    import google.generativeai as genai
+
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+    return genai.GenerativeModel(
         "models/gemini-1.5-flash"
     )
 
+
+def warm_up():
+    backend = os.getenv("KEYWORDS_BACKEND", DEFAULT_BACKEND)
+    if backend != "local":
+        _load_gemini()
+
+
+@traced("keywords.gemini")
+def _gemini(text: str, max_keywords: int) -> list[str]:
+
     prompt = (
         f"You are a video content assistant. Your job is to extract up to "
         f"{max_keywords} visually relevant keywords or phrases from the "
@@ -23,10 +179,50 @@ def extract_keywords(text: str, max_keywords: int = 3) -> list[str]:
     )
 
     try:
-        response = model.generate_content(prompt)
+        response = _load_gemini().generate_content(prompt)
         keywords_text = response.text.strip()
         keywords = [kw.strip().lower()
                     for kw in keywords_text.split(",") if kw.strip()]
         return keywords
-    except Exception:
+    except Exception as e:
+        logger.error(f"[Gemini] Failed to extract keywords: {e}")
         return []
+
+
+def _gemini_with_local_fallback(text: str, max_keywords: int) -> list[str]:
+    # The copied context keeps the job's trace span and log fields
+    future = _gemini_pool.submit(
+        copy_context().run, _gemini, text, max_keywords)
+    try:
+        keywords = future.result(timeout=GEMINI_TIMEOUT)
+    except TimeoutError:
+        # Drop it if it is still queued behind other slow calls
+        future.cancel()
+        logger.warning(
+            f"[Gemini] No response after {GEMINI_TIMEOUT}s, using local")
+        keywords = []
+
+    return keywords or _local(text, max_keywords)
+
+
+BACKENDS: Dict[str, Callable[[str, int], list[str]]] = {
+    "local": _local,
+    "gemini": _gemini,
+    "gemini-with-local-fallback": _gemini_with_local_fallback,
+}
+
+
+@traced("keywords")
+def extract_keywords(
+    text: str,
+    max_keywords: int = 3,
+    backend: Optional[str] = None
+) -> list[str]:
+    backend = backend or os.getenv("KEYWORDS_BACKEND", DEFAULT_BACKEND)
+    if backend not in BACKENDS:
+        raise ValueError(
+            f"Unsupported keywords backend '{backend}'. "
+            f"Choose one of: {', '.join(BACKENDS)}.")
+
+    annotate(backend=backend)
+    return BACKENDS[backend](text, max_keywords)
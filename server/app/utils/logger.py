@@ -1,11 +1,132 @@
+import atexit
+import copy
+import json
 import logging
+import os
+import queue
 import sys
-from logging.handlers import RotatingFileHandler
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
 from app.utils.constant import LOG_DIR, LOG_FILE_PATH
+from app.utils.metrics import (
+    LOG_RECORDS_DROPPED,
+    current_job_id,
+    current_stage,
+)
+
+# "json" for one structured object per line, "text" for the old format
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
 
 # Make sure log dir exists
 LOG_DIR.mkdir(parents=True, exist_ok=True)
 
+_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(LOG_QUEUE_SIZE)
+_listener: Optional[QueueListener] = None
+# Drops not yet reported in the log itself
+_dropped = 0
+_dropped_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(
+                record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "job_id": getattr(record, "job_id", None),
+            "stage": getattr(record, "stage", None),
+            "thread": record.threadName,
+        }
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class _ContextFilter(logging.Filter):
+    # Runs on the caller's thread, where the job's context is visible
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "job_id"):
+            record.job_id = current_job_id()
+        if not hasattr(record, "stage"):
+            record.stage = current_stage()
+        return True
+
+
+class _DroppingQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only merge the message here; the listener does the formatting.
+        # Tracebacks can't cross the queue, so they travel as text
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        # Never block a request on logging; drop when the listener lags
+        global _dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+            with _dropped_lock:
+                _dropped += 1
+            return
+
+        # Once there is room again, say in the log how much went missing
+        with _dropped_lock:
+            dropped, _dropped = _dropped, 0
+        if dropped:
+            warning = logging.LogRecord(
+                __name__, logging.WARNING, __file__, 0,
+                f"Dropped {dropped} log records, the log queue was full",
+                None, None)
+            try:
+                self.queue.put_nowait(warning)
+            except queue.Full:
+                with _dropped_lock:
+                    _dropped += dropped
+
+
+def _formatter() -> logging.Formatter:
+    if LOG_FORMAT == "text":
+        return logging.Formatter(
+            "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+        )
+    return JsonFormatter()
+
+
+def _start_listener() -> QueueListener:
+    global _listener
+    if _listener is None:
+        formatter = _formatter()
+
+        # Console Handler (stdout)
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(formatter)
+
+        # Rotating File Handler (logs/app.log)
+        file_handler = RotatingFileHandler(
+            LOG_FILE_PATH, maxBytes=5 * 1024 * 1024, backupCount=5
+        )
+        file_handler.setFormatter(formatter)
+
+        # Formatting, writes and rotation happen on the listener's thread
+        _listener = QueueListener(
+            _queue, console_handler, file_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+    return _listener
+
 
 def setup_logger(name: str) -> logging.Logger:
     logger = logging.getLogger(name)
@@ -15,22 +136,10 @@ def setup_logger(name: str) -> logging.Logger:
     if logger.hasHandlers():
         return logger
 
-    formatter = logging.Formatter(
-        "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-    )
-
-    # Console Handler (stdout)
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(formatter)
-
-    # Rotating File Handler (logs/app.log)
-    file_handler = RotatingFileHandler(
-        LOG_FILE_PATH, maxBytes=5 * 1024 * 1024, backupCount=5
-    )
-    file_handler.setFormatter(formatter)
+    _start_listener()
 
-    # Add handlers
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+    queue_handler = _DroppingQueueHandler(_queue)
+    queue_handler.addFilter(_ContextFilter())
+    logger.addHandler(queue_handler)
 
     return logger
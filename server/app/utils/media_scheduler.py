@@ -0,0 +1,235 @@
+import itertools
+import os
+import subprocess
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Deque, Dict, List
+import ffmpeg
+from app.utils.cancellation import current_token
+from app.utils.constant import STORAGE_DIR
+from app.utils.logger import setup_logger
+from app.utils.metrics import (
+    FFMPEG_QUEUE_SECONDS,
+    FFMPEG_REALTIME_FACTOR,
+    FFMPEG_RUN_SECONDS,
+    span,
+)
+
+logger = setup_logger(__name__)
+
+# Lower value is served first
+PRIORITIES = {"preview": 0, "interactive": 1, "batch": 2}
+DEFAULT_PRIORITY = "interactive"
+
+# libx264 already spreads one encode over several cores
+FFMPEG_SLOTS = int(os.getenv("FFMPEG_SLOTS", max(1, (os.cpu_count() or 2) // 2)))
+
+# Only the tail of each ffmpeg run's output is kept
+FFMPEG_LOG_LINES = int(os.getenv("FFMPEG_LOG_LINES", 200))
+FFMPEG_LOG_LINE_BYTES = 4096
+FFMPEG_LOG_NAME = "ffmpeg.log"
+
+_job_id: ContextVar[str] = ContextVar("media_job_id", default="anonymous")
+_priority: ContextVar[str] = ContextVar(
+    "media_priority", default=DEFAULT_PRIORITY)
+
+
+@contextmanager
+def media_job(job_id: str, priority: str = DEFAULT_PRIORITY):
+    if priority not in PRIORITIES:
+        raise ValueError(
+            f"Unsupported priority '{priority}'. "
+            f"Choose one of: {', '.join(PRIORITIES)}.")
+
+    job_token = _job_id.set(job_id)
+    priority_token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _job_id.reset(job_token)
+        _priority.reset(priority_token)
+
+
+def _drain(stream, lines: Deque[bytes]):
+    for line in iter(lambda: stream.readline(FFMPEG_LOG_LINE_BYTES), b""):
+        lines.append(line)
+    stream.close()
+
+
+def _drain_progress(stream, progress: Dict[str, float]):
+    # -progress reports key=value lines; the last out_time_us is how much
+    # media was written, so the run needs no separate ffprobe
+    for line in iter(lambda: stream.readline(FFMPEG_LOG_LINE_BYTES), b""):
+        key, _, value = line.decode("ascii", "replace").strip().partition("=")
+        if key == "out_time_us" and value.isdigit():
+            progress["media_seconds"] = int(value) / 1_000_000
+    stream.close()
+
+
+def _write_job_log(
+    job_id: str,
+    args: List[str],
+    lines: Deque[bytes],
+    return_code: int
+):
+    # Jobs outside the storage dir (benchmarks, scripts) keep no log
+    job_dir = STORAGE_DIR / job_id
+    if not job_dir.is_dir():
+        return
+    try:
+        with open(job_dir / FFMPEG_LOG_NAME, "ab") as f:
+            f.write(f"$ {' '.join(args)}\n".encode("utf-8"))
+            f.writelines(lines)
+            f.write(f"# exit code {return_code}\n\n".encode("utf-8"))
+    except OSError as e:
+        logger.warning(f"[{job_id}] Could not write ffmpeg log: {e}")
+
+
+class MediaScheduler:
+    def __init__(self, slots: int):
+        self.slots = slots
+        self._condition = threading.Condition()
+        self._running = 0
+        self._running_by_job: Dict[str, int] = defaultdict(int)
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._metrics = {
+            name: {"count": 0, "wait_sum": 0.0, "wait_max": 0.0,
+                   "run_sum": 0.0, "run_max": 0.0}
+            for name in PRIORITIES
+        }
+
+    def _next_ticket(self):
+        # Priority class first, then the job holding the fewest slots,
+        # then arrival order
+        return min(
+            self._waiting,
+            key=lambda t: (PRIORITIES[t[1]], self._running_by_job[t[0]], t[2])
+        )
+
+    def _acquire(self, job_id: str, priority: str):
+        token = current_token()
+        ticket = (job_id, priority, next(self._sequence))
+        with self._condition:
+            self._waiting.append(ticket)
+            try:
+                while (self._running >= self.slots
+                       or self._next_ticket() != ticket):
+                    # Wake up periodically so cancelled jobs leave the queue
+                    self._condition.wait(timeout=0.5)
+                    token.check()
+            finally:
+                self._waiting.remove(ticket)
+                self._condition.notify_all()
+            self._running += 1
+            self._running_by_job[job_id] += 1
+            # Another waiter may now be first in line for a free slot
+            self._condition.notify_all()
+
+    def _release(self, job_id: str):
+        with self._condition:
+            self._running -= 1
+            self._running_by_job[job_id] -= 1
+            if not self._running_by_job[job_id]:
+                del self._running_by_job[job_id]
+            self._condition.notify_all()
+
+    def _record(self, priority: str, wait_time: float, run_time: float):
+        FFMPEG_QUEUE_SECONDS.observe(wait_time, priority=priority)
+        FFMPEG_RUN_SECONDS.observe(run_time, priority=priority)
+        with self._condition:
+            metrics = self._metrics[priority]
+            metrics["count"] += 1
+            metrics["wait_sum"] += wait_time
+            metrics["wait_max"] = max(metrics["wait_max"], wait_time)
+            metrics["run_sum"] += run_time
+            metrics["run_max"] = max(metrics["run_max"], run_time)
+
+    def run(self, stream_spec):
+        job_id = _job_id.get()
+        priority = _priority.get()
+
+        token = current_token()
+        token.check()
+
+        with span("ffmpeg", priority=priority) as ffmpeg_span:
+            queued_at = time.perf_counter()
+            self._acquire(job_id, priority)
+            started_at = time.perf_counter()
+            try:
+                # stderr goes to a bounded buffer instead of the console
+                args = ffmpeg.compile(stream_spec)
+                args[1:1] = ["-hide_banner", "-nostats",
+                             "-progress", "pipe:1"]
+                lines: Deque[bytes] = deque(maxlen=FFMPEG_LOG_LINES)
+                progress: Dict[str, float] = {}
+                process = subprocess.Popen(
+                    args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                readers = [
+                    threading.Thread(target=_drain,
+                                     args=(process.stderr, lines),
+                                     daemon=True),
+                    threading.Thread(target=_drain_progress,
+                                     args=(process.stdout, progress),
+                                     daemon=True),
+                ]
+                for reader in readers:
+                    reader.start()
+                with token.on_cancel(process.kill):
+                    # wait4 reaps the child and reports its resource usage
+                    _, status, usage = os.wait4(process.pid, 0)
+                return_code = os.waitstatus_to_exitcode(status)
+                process.returncode = return_code
+                for reader in readers:
+                    reader.join()
+                _write_job_log(job_id, args, lines, return_code)
+                ffmpeg_span.set(cpu_user_seconds=usage.ru_utime,
+                                cpu_system_seconds=usage.ru_stime,
+                                max_rss_kb=usage.ru_maxrss)
+                token.check()
+                if return_code:
+                    stderr = b"".join(lines)
+                    logger.error(
+                        f"[{job_id}] ffmpeg exited with {return_code}: "
+                        f"{stderr[-1000:].decode('utf-8', 'replace')}")
+                    raise ffmpeg.Error("ffmpeg", None, stderr)
+            finally:
+                self._release(job_id)
+                finished_at = time.perf_counter()
+                wait_time = started_at - queued_at
+                run_time = finished_at - started_at
+                self._record(priority, wait_time, run_time)
+                ffmpeg_span.set(queue_seconds=wait_time, run_seconds=run_time)
+                logger.info(
+                    f"[{job_id}] ffmpeg waited {wait_time:.2f}s, "
+                    f"ran {run_time:.2f}s")
+
+            media_duration = progress.get("media_seconds")
+            if media_duration and run_time > 0:
+                realtime_factor = media_duration / run_time
+                FFMPEG_REALTIME_FACTOR.observe(realtime_factor)
+                ffmpeg_span.set(media_seconds=media_duration,
+                                realtime_factor=realtime_factor)
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                "slots": self.slots,
+                "running": self._running,
+                "waiting": len(self._waiting),
+                "running_by_job": dict(self._running_by_job),
+                "priorities": {
+                    name: dict(metrics)
+                    for name, metrics in self._metrics.items()
+                },
+            }
+
+
+scheduler = MediaScheduler(FFMPEG_SLOTS)
+
+
+def run_ffmpeg(stream_spec):
+    return scheduler.run(stream_spec)
@@ -0,0 +1,294 @@
+import bisect
+import functools
+import json
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+from app.utils.cancellation import JobCancelled
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+RATIO_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 16, 32, 64)
+MAX_TRACES = 200
+TRACE_FILE_NAME = "trace.json"
+
+_registry: List["_Metric"] = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value) -> str:
+    return (str(value).replace("\\", "\\\\").replace('"', '\\"')
+            .replace("\n", "\\n"))
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        f'{key}="{_escape(value)}"' for key, value in labels)
+    return "{" + pairs + "}"
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} {self.type_name}",
+            *self._samples(),
+        ]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, help_text: str):
+        super().__init__(name, help_text)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            return [
+                f"{self.name}{_format_labels(key)} {value}"
+                for key, value in self._values.items()
+            ]
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(buckets)
+        self._values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total = self._values.get(
+                key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def _samples(self) -> List[str]:
+        samples = []
+        with self._lock:
+            for key, (counts, total) in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += count
+                    bucket_key = key + (("le", bound),)
+                    samples.append(
+                        f"{self.name}_bucket{_format_labels(bucket_key)} "
+                        f"{cumulative}")
+                samples.append(
+                    f"{self.name}_sum{_format_labels(key)} {total}")
+                samples.append(
+                    f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return samples
+
+
+def render_prometheus() -> str:
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+STAGE_DURATION = Histogram(
+    "flikee_stage_duration_seconds", "Wall time spent in a pipeline stage.")
+STAGE_FAILURES = Counter(
+    "flikee_stage_failures_total",
+    "Pipeline stages that raised, by outcome (error or cancelled).")
+CACHE_HITS = Counter(
+    "flikee_cache_hits_total", "Work served from a cache.")
+CACHE_MISSES = Counter(
+    "flikee_cache_misses_total", "Work a cache could not serve.")
+DOWNLOAD_BYTES = Counter(
+    "flikee_download_bytes_total", "Bytes downloaded from providers.")
+LOG_RECORDS_DROPPED = Counter(
+    "flikee_log_records_dropped_total",
+    "Log records dropped because the log queue was full.")
+FFMPEG_QUEUE_SECONDS = Histogram(
+    "flikee_ffmpeg_queue_seconds", "Time ffmpeg jobs waited for a slot.")
+FFMPEG_RUN_SECONDS = Histogram(
+    "flikee_ffmpeg_run_seconds", "Wall time of ffmpeg invocations.")
+FFMPEG_REALTIME_FACTOR = Histogram(
+    "flikee_ffmpeg_realtime_factor",
+    "Seconds of media produced per second of ffmpeg wall time.",
+    buckets=RATIO_BUCKETS)
+JOBS_IN_PROGRESS = Gauge(
+    "flikee_jobs_in_progress", "Generation jobs currently running.")
+
+
+class Span:
+    def __init__(self, name: str, attributes: Optional[dict] = None):
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.children: List["Span"] = []
+        self.started_at = time.time()
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def add_child(self, child: "Span"):
+        with self._lock:
+            self.children.append(child)
+
+    def set(self, **attributes):
+        with self._lock:
+            self.attributes.update(attributes)
+
+    def add(self, key: str, amount: float):
+        with self._lock:
+            self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            children = list(self.children)
+            attributes = dict(self.attributes)
+        return {
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration": self.duration,
+            "error": self.error,
+            "attributes": attributes,
+            "children": [child.to_dict() for child in children],
+        }
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar(
+    "current_span", default=None)
+_current_job: ContextVar[Optional[str]] = ContextVar(
+    "current_job", default=None)
+_traces: "OrderedDict[str, Span]" = OrderedDict()
+_traces_lock = threading.Lock()
+_span_listeners: List[Tuple[Callable, Callable]] = []
+
+
+def add_span_listener(
+    on_start: Callable[[Span], None],
+    on_end: Callable[[Span], None]
+):
+    _span_listeners.append((on_start, on_end))
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_job_id() -> Optional[str]:
+    return _current_job.get()
+
+
+def current_stage() -> Optional[str]:
+    span = _current_span.get()
+    return span.name if span else None
+
+
+def annotate(**attributes):
+    span = _current_span.get()
+    if span:
+        span.set(**attributes)
+
+
+def count(key: str, amount: float = 1):
+    span = _current_span.get()
+    if span:
+        span.add(key, amount)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    parent = _current_span.get()
+    child = Span(name, attributes)
+    if parent:
+        parent.add_child(child)
+
+    token = _current_span.set(child)
+    for on_start, _ in _span_listeners:
+        on_start(child)
+    start = time.perf_counter()
+    try:
+        yield child
+    except BaseException as e:
+        child.error = f"{type(e).__name__}: {e}"
+        # A cancelled job is not a broken stage, keep it out of error rates
+        outcome = "cancelled" if isinstance(e, JobCancelled) else "error"
+        STAGE_FAILURES.inc(stage=name, outcome=outcome)
+        raise
+    finally:
+        child.duration = time.perf_counter() - start
+        STAGE_DURATION.observe(child.duration, stage=name)
+        for _, on_end in _span_listeners:
+            on_end(child)
+        _current_span.reset(token)
+
+
+def traced(name: str):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def trace_job(job_id: str, job_dir: Optional[Path] = None):
+    JOBS_IN_PROGRESS.inc(1)
+    job_token = _current_job.set(job_id)
+    try:
+        with span("job", job_id=job_id) as root:
+            with _traces_lock:
+                _traces[job_id] = root
+                while len(_traces) > MAX_TRACES:
+                    _traces.popitem(last=False)
+            yield root
+    finally:
+        _current_job.reset(job_token)
+        JOBS_IN_PROGRESS.inc(-1)
+        if job_dir is not None and job_dir.exists():
+            (job_dir / TRACE_FILE_NAME).write_text(
+                json.dumps(root.to_dict(), indent=2, default=str))
+
+
+def get_trace(job_id: str, job_dir: Optional[Path] = None) -> Optional[dict]:
+    with _traces_lock:
+        root = _traces.get(job_id)
+    if root is not None:
+        return root.to_dict()
+    if job_dir is not None and (job_dir / TRACE_FILE_NAME).exists():
+        return json.loads((job_dir / TRACE_FILE_NAME).read_text())
+    return None
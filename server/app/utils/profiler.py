@@ -0,0 +1,184 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Dict, List, Optional
+from app.utils.logger import setup_logger
+from app.utils.metrics import Span, add_span_listener
+
+logger = setup_logger(__name__)
+
+PROFILE_HEADER = "X-Profile"
+# Fraction of requests profiled without asking (0.0 - 1.0)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+PROFILE_DIR_NAME = "profile"
+PROFILE_FILES = ("cpu.prof", "cpu.txt", "memory.json", "ffmpeg.json")
+TOP_FUNCTIONS = 50
+
+_active: ContextVar[Optional["JobProfile"]] = ContextVar(
+    "active_profile", default=None)
+_tracemalloc_users = 0
+_tracemalloc_lock = threading.Lock()
+
+
+def should_profile(header_value: Optional[str]) -> bool:
+    if header_value is not None:
+        return header_value.strip().lower() in ("1", "true", "yes", "on")
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def _start_tracemalloc():
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        if not _tracemalloc_users and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _tracemalloc_users += 1
+
+
+def _stop_tracemalloc():
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if not _tracemalloc_users:
+            tracemalloc.stop()
+
+
+class JobProfile:
+    def __init__(self, job_dir: Path):
+        self.profile_dir = job_dir / PROFILE_DIR_NAME
+        self.stages: List[Dict] = []
+        self._peaks: Dict[int, int] = {}
+        self._stack: List[Span] = []
+        self._lock = threading.Lock()
+
+    def stage_started(self, stage: Span):
+        # Peaks are tracked per stage by resetting the tracemalloc peak, so
+        # fold the peak seen so far into the enclosing stage first
+        with self._lock:
+            _, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                parent = id(self._stack[-1])
+                self._peaks[parent] = max(self._peaks[parent], peak)
+            self._stack.append(stage)
+            self._peaks[id(stage)] = 0
+            tracemalloc.reset_peak()
+
+    def stage_finished(self, stage: Span):
+        with self._lock:
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(peak, self._peaks.pop(id(stage), 0))
+            if stage in self._stack:
+                self._stack.remove(stage)
+            if self._stack:
+                parent = id(self._stack[-1])
+                self._peaks[parent] = max(self._peaks[parent], peak)
+            self.stages.append({
+                "stage": stage.name,
+                "duration": stage.duration,
+                "peak_bytes": peak,
+                "current_bytes": current,
+            })
+
+    def save(
+        self,
+        profiler: Optional[cProfile.Profile],
+        root: Optional[Span]
+    ):
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+
+        if profiler is not None:
+            profiler.dump_stats(str(self.profile_dir / "cpu.prof"))
+            summary = io.StringIO()
+            stats = pstats.Stats(profiler, stream=summary)
+            stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+            (self.profile_dir / "cpu.txt").write_text(summary.getvalue())
+
+        (self.profile_dir / "memory.json").write_text(json.dumps({
+            # tracemalloc is process wide, concurrent jobs add to the numbers
+            "concurrent_profiles": _tracemalloc_users,
+            "stages": self.stages,
+        }, indent=2))
+
+        ffmpeg_runs = _ffmpeg_usage(root.to_dict()) if root else []
+        (self.profile_dir / "ffmpeg.json").write_text(json.dumps({
+            "runs": ffmpeg_runs,
+            "cpu_user_seconds": sum(
+                run.get("cpu_user_seconds", 0) for run in ffmpeg_runs),
+            "cpu_system_seconds": sum(
+                run.get("cpu_system_seconds", 0) for run in ffmpeg_runs),
+        }, indent=2))
+
+
+def _ffmpeg_usage(trace: dict, stage: Optional[str] = None) -> List[dict]:
+    # The scheduler records each ffmpeg child's rusage on its span
+    runs = []
+    for child in trace["children"]:
+        if child["name"] == "ffmpeg":
+            runs.append({"stage": stage, "duration": child["duration"],
+                         **child["attributes"]})
+        else:
+            runs.extend(_ffmpeg_usage(child, child["name"]))
+    return runs
+
+
+def _on_span_start(stage: Span):
+    profile = _active.get()
+    if profile:
+        profile.stage_started(stage)
+
+
+def _on_span_end(stage: Span):
+    profile = _active.get()
+    if profile:
+        profile.stage_finished(stage)
+
+
+add_span_listener(_on_span_start, _on_span_end)
+
+
+@contextmanager
+def profile_job(job_dir: Path, root: Optional[Span] = None):
+    # cProfile only sees the thread it was enabled on, so enter this on the
+    # worker thread that runs the pipeline
+    profile = JobProfile(job_dir)
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as e:
+        # Newer Pythons allow a single active profiler per process
+        logger.warning(f"[{job_dir.name}] CPU profile skipped: {e}")
+        profiler = None
+
+    _start_tracemalloc()
+    token = _active.set(profile)
+    try:
+        yield profile
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        _active.reset(token)
+        try:
+            if job_dir.exists():
+                profile.save(profiler, root)
+                logger.info(f"[{job_dir.name}] Profile saved")
+        except Exception as e:
+            logger.error(f"[{job_dir.name}] Could not save profile: {e}")
+        finally:
+            _stop_tracemalloc()
+
+
+def profiled(job_dir: Path, root: Optional[Span], func, *args):
+    with profile_job(job_dir, root):
+        return func(*args)
+
+
+def list_profile(job_dir: Path) -> List[str]:
+    profile_dir = job_dir / PROFILE_DIR_NAME
+    return [name for name in PROFILE_FILES if (profile_dir / name).exists()]
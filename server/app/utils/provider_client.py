@@ -0,0 +1,225 @@
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+import requests
+from app.utils.cancellation import current_token
+from app.utils.logger import setup_logger
+from app.utils.metrics import Counter, Gauge, Histogram, annotate
+
+logger = setup_logger(__name__)
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Circuit states, exported as gauge values
+CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+STATE_NAMES = {CLOSED: "closed", HALF_OPEN: "half_open", OPEN: "open"}
+
+PROVIDER_REQUESTS = Counter(
+    "flikee_provider_requests_total",
+    "Provider HTTP attempts by outcome.")
+PROVIDER_RETRIES = Counter(
+    "flikee_provider_retries_total", "Provider requests that were retried.")
+PROVIDER_LATENCY = Histogram(
+    "flikee_provider_latency_seconds", "Latency of provider HTTP attempts.")
+PROVIDER_CIRCUIT_STATE = Gauge(
+    "flikee_provider_circuit_state",
+    "Provider circuit breaker state (0 closed, 1 half-open, 2 open).")
+
+
+class ProviderUnavailable(Exception):
+    pass
+
+
+class CircuitBreaker:
+    # Opens after `failure_threshold` failures in a row, lets a single
+    # probe through after `reset_timeout` seconds, closes on its success
+    def __init__(self, name: str, failure_threshold: int,
+                 reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        PROVIDER_CIRCUIT_STATE.set(CLOSED, provider=name)
+
+    def _set_state(self, state: int):
+        if state != self._state:
+            logger.warning(f"[{self.name}] Circuit {STATE_NAMES[state]}")
+        self._state = state
+        PROVIDER_CIRCUIT_STATE.set(state, provider=self.name)
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if (self._state == OPEN
+                    and time.monotonic() - self._opened_at
+                    >= self.reset_timeout):
+                return STATE_NAMES[HALF_OPEN]
+            return STATE_NAMES[self._state]
+
+    def available(self) -> bool:
+        return self.state != "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if (self._state == OPEN
+                    and time.monotonic() - self._opened_at
+                    >= self.reset_timeout):
+                self._set_state(HALF_OPEN)
+            if self._state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            self._set_state(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if (self._state == HALF_OPEN
+                    or self._failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+
+def _retry_after(response: requests.Response) -> Optional[float]:
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _env(name: str, key: str, default: float) -> float:
+    prefix = name.upper().replace("-", "_")
+    return float(os.getenv(f"{prefix}_{key}", default))
+
+
+class ProviderClient:
+    def __init__(
+        self,
+        name: str,
+        timeout: float = 10,
+        budget: float = 20,
+        retries: int = 3,
+        backoff: float = 0.5,
+        backoff_cap: float = 8,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30
+    ):
+        # e.g. PEXELS_TIMEOUT, PEXELS_BUDGET, PEXELS_RETRIES
+        self.name = name
+        self.timeout = _env(name, "TIMEOUT", timeout)
+        self.budget = _env(name, "BUDGET", budget)
+        self.retries = int(_env(name, "RETRIES", retries))
+        self.backoff = backoff
+        self.backoff_cap = backoff_cap
+        self.breaker = CircuitBreaker(
+            name,
+            int(_env(name, "FAILURE_THRESHOLD", failure_threshold)),
+            _env(name, "RESET_TIMEOUT", reset_timeout))
+        self._session = requests.Session()
+
+    def available(self) -> bool:
+        return self.breaker.available()
+
+    def _delay(self, attempt: int,
+               response: Optional[requests.Response]) -> float:
+        if response is not None:
+            retry_after = _retry_after(response)
+            if retry_after is not None:
+                return retry_after
+        # Full jitter keeps retries from many jobs from lining up
+        return random.uniform(
+            0, min(self.backoff_cap, self.backoff * 2 ** attempt))
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        token = current_token()
+        deadline = time.monotonic() + self.budget
+
+        for attempt in range(self.retries + 1):
+            token.check()
+            if not self.breaker.allow():
+                raise ProviderUnavailable(f"{self.name} circuit is open")
+
+            remaining = deadline - time.monotonic()
+            response = None
+            start = time.perf_counter()
+            try:
+                response = self._session.get(
+                    url, timeout=min(self.timeout, max(remaining, 0.1)),
+                    **kwargs)
+                outcome = str(response.status_code)
+                failed = response.status_code in RETRYABLE_STATUS
+            except requests.RequestException as e:
+                outcome = type(e).__name__
+                failed = True
+                error = e
+            except BaseException:
+                # Never leave a half-open probe outstanding, or the circuit
+                # would refuse every request from here on
+                self.breaker.record_failure()
+                raise
+            PROVIDER_LATENCY.observe(
+                time.perf_counter() - start, provider=self.name)
+            PROVIDER_REQUESTS.inc(provider=self.name, outcome=outcome)
+
+            if not failed:
+                self.breaker.record_success()
+                annotate(attempts=attempt + 1)
+                response.raise_for_status()
+                return response
+
+            self.breaker.record_failure()
+            delay = self._delay(attempt, response)
+            if (attempt == self.retries
+                    or time.monotonic() + delay >= deadline):
+                break
+
+            logger.warning(
+                f"[{self.name}] {outcome}, retrying in {delay:.2f}s")
+            PROVIDER_RETRIES.inc(provider=self.name)
+            if response is not None:
+                response.close()
+            token.sleep(delay)
+
+        annotate(attempts=attempt + 1)
+        if response is not None:
+            response.raise_for_status()
+        raise error
+
+
+_clients: Dict[str, ProviderClient] = {}
+_clients_lock = threading.Lock()
+
+
+def provider_client(name: str, **defaults) -> ProviderClient:
+    with _clients_lock:
+        if name not in _clients:
+            _clients[name] = ProviderClient(name, **defaults)
+        return _clients[name]
+
+
+def provider_health() -> Dict[str, str]:
+    with _clients_lock:
+        clients = list(_clients.values())
+    return {client.name: client.breaker.state for client in clients}
@@ -0,0 +1,88 @@
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable
+from app.utils.cancellation import JobCancelled, current_token
+from app.utils.metrics import CACHE_HITS, CACHE_MISSES
+
+# Handed to waiters when the owner stopped for its own reasons (e.g. its
+# job was cancelled); they are not cancelled, so one of them takes over
+_RETRY = object()
+
+
+def _wait(future: Future):
+    # Waiting ends early if the waiter's own job is cancelled
+    token = current_token()
+    ready = threading.Event()
+    future.add_done_callback(lambda _: ready.set())
+    with token.on_cancel(ready.set):
+        ready.wait()
+    token.check()
+
+
+class SingleFlight:
+    # Runs each key's work once and shares the result with every caller,
+    # including callers that arrive while the work is still in flight
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._results: Dict[Hashable, Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _forget(self, key: Hashable):
+        with self._lock:
+            self._results.pop(key, None)
+
+    def do(
+        self,
+        key: Hashable,
+        func: Callable[[], Any],
+        keep: Callable[[Any], bool] = lambda result: True
+    ) -> Any:
+        while True:
+            with self._lock:
+                future = self._results.get(key)
+                owner = future is None
+                if owner:
+                    future = Future()
+                    self._results[key] = future
+                    self.misses += 1
+                else:
+                    self.hits += 1
+
+            if owner:
+                return self._run(key, future, func, keep)
+
+            CACHE_HITS.inc(cache=self.name)
+            _wait(future)
+            result = future.result()
+            if result is not _RETRY:
+                return result
+
+    def _run(
+        self,
+        key: Hashable,
+        future: Future,
+        func: Callable[[], Any],
+        keep: Callable[[Any], bool]
+    ) -> Any:
+        CACHE_MISSES.inc(cache=self.name)
+        try:
+            result = func()
+        except BaseException as e:
+            # Let a later caller retry instead of caching the failure
+            self._forget(key)
+            if isinstance(e, Exception) and not isinstance(e, JobCancelled):
+                future.set_exception(e)
+            else:
+                # Cancellation belongs to the owner's job alone, never
+                # share it with the waiters
+                future.set_result(_RETRY)
+            raise
+
+        # Results `keep` rejects (empty or failed) go to the callers already
+        # waiting, later ones try again
+        if not keep(result):
+            self._forget(key)
+        future.set_result(result)
+        return result
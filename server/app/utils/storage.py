@@ -0,0 +1,239 @@
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List
+from app.utils.constant import CACHE_DIR, STORAGE_DIR
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Seconds to keep intermediates after a job finishes (0 = delete at once,
+# negative = keep until the quota evicts the job)
+INTERMEDIATE_RETENTION = float(
+    os.getenv("STORAGE_INTERMEDIATE_RETENTION", 3600))
+# Seconds to keep a whole job since it was last used (0 = no age limit)
+FINAL_RETENTION = float(os.getenv("STORAGE_FINAL_RETENTION", 0))
+# Bytes all jobs and caches together may use (0 = no quota)
+STORAGE_QUOTA_BYTES = int(os.getenv("STORAGE_QUOTA_BYTES", 20 * 1024 ** 3))
+JANITOR_INTERVAL = float(os.getenv("STORAGE_JANITOR_INTERVAL", 300))
+
+CATEGORIES = ("final", "intermediate", "meta")
+
+JOB_DIR_PATTERN = re.compile(r"^\d{8}_\d{6}(_[0-9a-f]+)?$")
+BATCH_CACHE_PATTERN = re.compile(r"^batch_\d{8}_\d{6}(_[0-9a-f]+)?$")
+INTERMEDIATE_PATTERNS = [
+    re.compile(pattern) for pattern in (
+        r"^downloads/",
+        r"^temp/",
+        r"^segments/clip_\d+\.mp4$",
+        r"^segments/.*\.srt$",
+        r"^concatenated\.mp4$",
+        r"^voiceovered\.mp4$",
+        r"^list\.txt$",
+    )
+]
+META_PATTERNS = [
+    re.compile(pattern) for pattern in (
+        r"\.json$",
+        r"\.tmp$",
+        r"\.log$",
+        r"^profile/",
+    )
+]
+
+
+def new_job_id() -> str:
+    # The timestamp keeps folders sortable, the suffix keeps them unique
+    return f"{datetime.now():%Y%m%d_%H%M%S}_{uuid.uuid4().hex[:8]}"
+
+
+def create_job_dir() -> Path:
+    while True:
+        job_dir = STORAGE_DIR / new_job_id()
+        try:
+            job_dir.mkdir(parents=True)
+            return job_dir
+        except FileExistsError:
+            continue
+
+
+def categorize(relative_path: str) -> str:
+    if any(p.search(relative_path) for p in INTERMEDIATE_PATTERNS):
+        return "intermediate"
+    if any(p.search(relative_path) for p in META_PATTERNS):
+        return "meta"
+    return "final"
+
+
+def _job_files(job_dir: Path) -> Iterable[Path]:
+    return (path for path in job_dir.rglob("*") if path.is_file())
+
+
+def _job_dirs() -> List[Path]:
+    if not STORAGE_DIR.exists():
+        return []
+    return [
+        path for path in STORAGE_DIR.iterdir()
+        if path.is_dir() and JOB_DIR_PATTERN.match(path.name)
+    ]
+
+
+def _remove_empty_dirs(job_dir: Path):
+    for path in sorted(job_dir.rglob("*"), reverse=True):
+        if path.is_dir():
+            try:
+                path.rmdir()  # only deletes if empty
+            except OSError:
+                pass
+
+
+def cleanup_intermediates(job_dir: Path, older_than: float = 0) -> int:
+    freed = 0
+    now = time.time()
+    for path in _job_files(job_dir):
+        relative_path = path.relative_to(job_dir).as_posix()
+        if categorize(relative_path) != "intermediate":
+            continue
+        try:
+            stat = path.stat()
+            if now - stat.st_mtime < older_than:
+                continue
+            path.unlink()
+            freed += stat.st_size
+        except OSError:
+            continue
+
+    _remove_empty_dirs(job_dir)
+    return freed
+
+
+def finish_job(job_dir: Path):
+    if INTERMEDIATE_RETENTION == 0:
+        freed = cleanup_intermediates(job_dir)
+        logger.info(f"[{job_dir.name}] Removed {freed} bytes of intermediates")
+
+
+def _job_usage(job_dir: Path) -> Dict[str, float]:
+    usage = {category: 0 for category in CATEGORIES}
+    last_used = 0.0
+    for path in _job_files(job_dir):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        relative_path = path.relative_to(job_dir).as_posix()
+        usage[categorize(relative_path)] += stat.st_size
+        last_used = max(last_used, stat.st_atime, stat.st_mtime)
+    usage["last_used"] = last_used
+    return usage
+
+
+def _cache_usage() -> int:
+    # Shared between jobs (thumbnail hashes, batch clip caches), so it is
+    # counted apart from any one job
+    if not CACHE_DIR.exists():
+        return 0
+    total = 0
+    for path in _job_files(CACHE_DIR):
+        try:
+            total += path.stat().st_size
+        except OSError:
+            continue
+    return total
+
+
+def storage_stats() -> dict:
+    categories = {category: 0 for category in CATEGORIES}
+    jobs = 0
+    for job_dir in _job_dirs():
+        usage = _job_usage(job_dir)
+        for category in CATEGORIES:
+            categories[category] += usage[category]
+        jobs += 1
+    categories["cache"] = _cache_usage()
+
+    total = sum(categories.values())
+    return {
+        "quota_bytes": STORAGE_QUOTA_BYTES,
+        "total_bytes": total,
+        "usage_ratio": (
+            total / STORAGE_QUOTA_BYTES if STORAGE_QUOTA_BYTES > 0 else None),
+        "jobs": jobs,
+        "categories": categories,
+    }
+
+
+def _sweep_batch_caches(active: set, grace: float):
+    # A batch removes its cache when it ends, unless the process died first
+    # or the client never read the response. Fresh ones may belong to a
+    # batch whose stream hasn't started yet
+    if not CACHE_DIR.exists():
+        return
+    now = time.time()
+    for path in CACHE_DIR.iterdir():
+        if (not path.is_dir() or not BATCH_CACHE_PATTERN.match(path.name)
+                or path.name in active):
+            continue
+        try:
+            if now - path.stat().st_mtime < grace:
+                continue
+        except OSError:
+            continue
+        logger.info(f"[{path.name}] Orphaned batch cache, removing")
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def enforce_retention(active_jobs: Callable[[], List[str]]):
+    active = set(active_jobs())
+    now = time.time()
+    _sweep_batch_caches(active, grace=JANITOR_INTERVAL)
+
+    jobs = []
+    for job_dir in _job_dirs():
+        if job_dir.name in active:
+            continue
+
+        if INTERMEDIATE_RETENTION >= 0:
+            cleanup_intermediates(job_dir, older_than=INTERMEDIATE_RETENTION)
+
+        usage = _job_usage(job_dir)
+        if FINAL_RETENTION > 0 and now - usage["last_used"] > FINAL_RETENTION:
+            logger.info(f"[{job_dir.name}] Expired, removing")
+            shutil.rmtree(job_dir, ignore_errors=True)
+            continue
+        jobs.append((usage["last_used"], job_dir,
+                     sum(usage[c] for c in CATEGORIES)))
+
+    if STORAGE_QUOTA_BYTES <= 0:
+        return
+
+    # Evict least recently used jobs until usage fits in the quota
+    total = _cache_usage() + sum(size for _, _, size in jobs)
+    for _, job_dir, size in sorted(jobs, key=lambda job: job[0]):
+        if total <= STORAGE_QUOTA_BYTES:
+            break
+        logger.info(f"[{job_dir.name}] Evicted to free {size} bytes")
+        shutil.rmtree(job_dir, ignore_errors=True)
+        total -= size
+
+
+def start_janitor(
+    active_jobs: Callable[[], List[str]],
+    interval: float = JANITOR_INTERVAL
+) -> threading.Event:
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            try:
+                enforce_retention(active_jobs)
+            except Exception as e:
+                logger.error(f"Storage janitor failed: {e}")
+
+    threading.Thread(target=run, name="storage-janitor", daemon=True).start()
+    return stop
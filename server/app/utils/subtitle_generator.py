@@ -1,8 +1,17 @@
 import os
+from functools import lru_cache
 from pathlib import Path
-from faster_whisper import WhisperModel
+from typing import TYPE_CHECKING
 import ffmpeg
 import pysubs2
+from app.utils.cancellation import check_cancelled
+from app.utils.metrics import traced
+
+# faster_whisper is imported on first use; it takes seconds to load
+if TYPE_CHECKING:
+    from faster_whisper import WhisperModel
+
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "tiny")
 
 
 def _export_srt(words, filename, max_words_per_line=7):
@@ -39,23 +48,36 @@ def _export_srt(words, filename, max_words_per_line=7):
     subs.save(filename)
 
 
+@lru_cache(maxsize=2)
+def _load_whisper(model: str) -> "WhisperModel":
+    from faster_whisper import WhisperModel
+
+    return WhisperModel(model, device="cpu", compute_type="float32")
+
+
+def warm_up():
+    _load_whisper(WHISPER_MODEL)
+
+
+@traced("asr.transcribe")
 def _faster_whisper(
     voiceover_path: str,
         output_path: str,
-        model: str = "tiny",
+        model: str = WHISPER_MODEL,
         text: str = "",
         language: str = "id"
 ) -> str:
-    model = WhisperModel(model, device="cpu", compute_type="float32")
-    segments, _ = model.transcribe(
+    segments, _ = _load_whisper(model).transcribe(
         audio=voiceover_path,
         language=language,
         initial_prompt=text,
         word_timestamps=True
     )
 
+    # Segments are decoded lazily, so this loop is where the work happens
     words = []
     for segment in segments:
+        check_cancelled()
         for word in segment.words:
             words.append((word.start, word.end, word.word))
 
@@ -64,6 +86,7 @@ def _faster_whisper(
     return output_path
 
 
+@traced("asr")
 def generate_subtitle(
     voiceover_path: str,
     text: str,
@@ -0,0 +1,193 @@
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from pathlib import Path
+from typing import List, Optional
+from urllib.parse import urlparse
+from PIL import Image
+from app.models.candidate import Candidate
+from app.utils.cancellation import JobCancelled, check_cancelled
+from app.utils.constant import CACHE_DIR
+from app.utils.logger import setup_logger
+from app.utils.metrics import Counter, count, traced
+from app.utils.provider_client import provider_client
+
+logger = setup_logger(__name__)
+
+# Max differing bits between two 64-bit dHashes to call them duplicates
+DEDUP_MAX_DISTANCE = int(os.getenv("DEDUP_MAX_DISTANCE", 6))
+DEDUP_WORKERS = 8
+HASH_CACHE_PATH = CACHE_DIR / "thumbnail_hashes.json"
+HASH_CACHE_SIZE = 50000
+
+DUPLICATES_DROPPED = Counter(
+    "flikee_duplicates_dropped_total",
+    "Curated videos dropped as duplicates of a better match.")
+
+# Where each provider keeps the footage id in its file URLs, e.g.
+# .../231942_medium.mp4 and .../video-files/1557401/...
+PROVIDER_ID_PATTERNS = {
+    "pixabay": re.compile(r"/(\d+)(?:-\d+)?_\w+\.mp4$"),
+    "pexels": re.compile(r"/video-files/(\d+)/"),
+}
+
+
+def _provider_id(video: Candidate) -> Optional[str]:
+    pattern = PROVIDER_ID_PATTERNS.get(video.source)
+    match = pattern.search(urlparse(str(video.url)).path) if pattern else None
+    return f"{video.source}:{match.group(1)}" if match else None
+
+
+def _url_key(url) -> str:
+    parsed = urlparse(str(url))
+    return f"{parsed.netloc}{parsed.path}"
+
+
+class HashCache:
+    # Thumbnail URL -> dHash, persisted between runs and capped in size
+    def __init__(self, path=HASH_CACHE_PATH, max_size: int = HASH_CACHE_SIZE):
+        self.path = path
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._hashes: Optional["OrderedDict[str, int]"] = None
+        self._dirty = False
+
+    def _load(self):
+        if self._hashes is not None:
+            return
+        self._hashes = OrderedDict()
+        try:
+            for key, value in json.loads(self.path.read_text()).items():
+                self._hashes[key] = int(value, 16)
+        except FileNotFoundError:
+            pass
+        except ValueError:
+            logger.warning(f"Ignoring unreadable hash cache {self.path}")
+
+    def get(self, key: str) -> Optional[int]:
+        with self._lock:
+            self._load()
+            return self._hashes.get(key)
+
+    def put(self, key: str, value: int):
+        with self._lock:
+            self._load()
+            self._hashes[key] = value
+            while len(self._hashes) > self.max_size:
+                self._hashes.popitem(last=False)
+            self._dirty = True
+
+    def save(self):
+        # Jobs save concurrently: one save at a time, each through its own
+        # temp file, and the snapshot taken under the same lock so an older
+        # one never replaces a newer one
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                payload = {key: f"{value:016x}"
+                           for key, value in self._hashes.items()}
+                self._dirty = False
+
+            temp_path = None
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with tempfile.NamedTemporaryFile(
+                        "w", dir=self.path.parent, suffix=".tmp",
+                        delete=False) as f:
+                    temp_path = f.name
+                    f.write(json.dumps(payload))
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                logger.warning(f"Could not save hash cache: {e}")
+                if temp_path is not None:
+                    Path(temp_path).unlink(missing_ok=True)
+
+
+hash_cache = HashCache()
+
+
+def dhash(image: Image.Image) -> int:
+    # Compare each pixel with its right neighbour on a 9x8 grayscale copy
+    pixels = list(image.convert("L").resize((9, 8), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+@traced("dedup.thumbnail")
+def _thumbnail_hash(video: Candidate) -> Optional[int]:
+    if video.thumbnail is None:
+        return None
+    key = _url_key(video.thumbnail)
+    cached = hash_cache.get(key)
+    if cached is not None:
+        count("hash_cache_hits")
+        return cached
+
+    try:
+        client = provider_client(
+            f"{video.source}-thumbnails", timeout=5, budget=10, retries=1)
+        response = client.get(str(video.thumbnail))
+        value = dhash(Image.open(io.BytesIO(response.content)))
+    except JobCancelled:
+        raise
+    except Exception as e:
+        logger.warning(f"Could not hash thumbnail {video.thumbnail}: {e}")
+        return None
+
+    hash_cache.put(key, value)
+    return value
+
+
+@traced("dedup")
+def drop_duplicates(videos: List[Candidate]) -> List[Candidate]:
+    # Videos come best-first, so the first of each duplicate group is kept
+    unique = []
+    seen = set()
+    for video in videos:
+        keys = {_url_key(video.url), _provider_id(video)} - {None}
+        if keys & seen:
+            continue
+        seen |= keys
+        unique.append(video)
+    exact = len(videos) - len(unique)
+
+    check_cancelled()
+    with ThreadPoolExecutor(max_workers=DEDUP_WORKERS) as executor:
+        futures = [
+            executor.submit(copy_context().run, _thumbnail_hash, video)
+            for video in unique
+        ]
+        hashes = [future.result() for future in futures]
+    hash_cache.save()
+
+    kept, kept_hashes = [], []
+    for video, value in zip(unique, hashes):
+        if value is not None and any(
+                bin(value ^ other).count("1") <= DEDUP_MAX_DISTANCE
+                for other in kept_hashes):
+            continue
+        kept.append(video)
+        if value is not None:
+            kept_hashes.append(value)
+    near = len(unique) - len(kept)
+
+    if exact or near:
+        logger.info(
+            f"Dropped {exact} exact and {near} near duplicate videos")
+    DUPLICATES_DROPPED.inc(exact, kind="exact")
+    DUPLICATES_DROPPED.inc(near, kind="near")
+    count("duplicates_dropped", exact + near)
+    return kept
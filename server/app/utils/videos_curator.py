@@ -1,13 +1,35 @@
 import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import copy_context
 from urllib.parse import urlparse
-import requests
-from typing import List, Optional
-from app.models.video import Video
+from typing import Callable, Dict, List, Optional
+from app.models.candidate import Candidate
+from app.utils.cancellation import check_cancelled
 from app.utils.logger import setup_logger
+from app.utils.metrics import Counter, count, traced
+from app.utils.provider_client import provider_client
 from app.utils.similarity_score import compute_similarity_score
+from app.utils.single_flight import SingleFlight
+from app.utils.video_dedup import drop_duplicates
 
 logger = setup_logger(__name__)
 
+# Once one source has answered, the other gets this much longer before
+# curation moves on without it
+HEDGE_DELAY = float(os.getenv("CURATION_HEDGE_DELAY", 2))
+
+SEARCH_HEDGED = Counter(
+    "flikee_search_hedged_total",
+    "Searches abandoned because the other source answered first.")
+SEARCH_SKIPPED = Counter(
+    "flikee_search_skipped_total",
+    "Searches skipped because the source's circuit was open.")
+
+# In-flight searches per source; abandoned ones keep a slot until their
+# budget runs out, so their outcome still reaches the circuit breaker
+SEARCH_WORKERS = int(os.getenv("CURATION_SEARCH_WORKERS", 4))
+
 
 def _parse_video(
     source: str,
@@ -19,25 +41,33 @@ def _parse_video(
     height: Optional[float],
     thumbnail: Optional[str],
     similarity_score: Optional[float]
-) -> Optional[Video]:
-    try:
-        return Video(
-            source=source,
-            keyword=keyword,
-            description=description,
-            url=url,
-            duration=duration,
-            width=width,
-            height=height,
-            thumbnail=thumbnail,
-            similarity_score=similarity_score
-        )
-    except Exception as e:
-        logger.warning(f"[{source.capitalize()}] Skipping invalid video: {e}")
+) -> Optional[Candidate]:
+    # Full validation waits until a clip is selected; only reject hits
+    # that could never be used
+    if not isinstance(url, str) or not url.startswith(("http://", "https://")):
+        logger.warning(
+            f"[{source.capitalize()}] Skipping video without a valid url")
         return None
+    if not isinstance(duration, (int, float)):
+        logger.warning(
+            f"[{source.capitalize()}] Skipping video without a duration")
+        return None
+
+    return Candidate(
+        source=source,
+        keyword=keyword,
+        description=description,
+        url=url,
+        duration=duration,
+        width=width,
+        height=height,
+        thumbnail=thumbnail,
+        similarity_score=similarity_score
+    )
 
 
-def _pixabay(query: str, limit: int = 5) -> List[Video]:
+@traced("search.pixabay")
+def _pixabay(query: str, limit: int = 5) -> List[Candidate]:
     def get_description(tags: str) -> str:
         return tags.replace(",", "")
 
@@ -54,8 +84,7 @@ def _pixabay(query: str, limit: int = 5) -> List[Video]:
     }
 
     try:
-        response = requests.get(base_url, params=params)
-        response.raise_for_status()
+        response = provider_client("pixabay").get(base_url, params=params)
         data = response.json()
         logger.info(
             f"[Pixabay] {len(data.get('hits', []))} results for '{query}'")
@@ -91,7 +120,8 @@ def _pixabay(query: str, limit: int = 5) -> List[Video]:
     return videos
 
 
-def _pexels(query: str, limit: int = 5) -> List[Video]:
+@traced("search.pexels")
+def _pexels(query: str, limit: int = 5) -> List[Candidate]:
     def get_description(url: str) -> str:
         path = urlparse(url).path
         slug = path.strip("/").split("/")[-1]
@@ -110,9 +140,8 @@ def _pexels(query: str, limit: int = 5) -> List[Video]:
     }
 
     try:
-        response = requests.get(base_url + "search",
-                                headers=headers, params=params)
-        response.raise_for_status()
+        response = provider_client("pexels").get(
+            base_url + "search", headers=headers, params=params)
         data = response.json()
         logger.info(
             f"[Pexels] {len(data.get('videos', []))} results for '{query}'")
@@ -147,16 +176,96 @@ def _pexels(query: str, limit: int = 5) -> List[Video]:
     return videos
 
 
+SOURCES: Dict[str, Callable[[str, int], List[Candidate]]] = {
+    "pixabay": _pixabay,
+    "pexels": _pexels,
+}
+
+# One pool per source, so a degraded source can't hold up the others
+_search_pools = {
+    name: ThreadPoolExecutor(max_workers=SEARCH_WORKERS,
+                             thread_name_prefix=f"search-{name}")
+    for name in SOURCES
+}
+
+
+def _search(
+    query: str,
+    limit: int,
+    search_cache: Optional[SingleFlight] = None
+) -> List[Candidate]:
+    def run(name: str, source_limit: int) -> List[Candidate]:
+        source = SOURCES[name]
+        if search_cache is None:
+            return source(query, source_limit)
+        # Scripts in a batch often share keywords; search once. An empty
+        # result may be a swallowed provider error, so it isn't kept
+        return search_cache.do(
+            (source.__name__, query, source_limit),
+            lambda: source(query, source_limit),
+            keep=bool)
+
+    # A source whose circuit is open is left out, the others make up
+    # for its share of the results
+    healthy = [name for name in SOURCES if provider_client(name).available()]
+    for name in SOURCES:
+        if name not in healthy:
+            SEARCH_SKIPPED.inc(source=name)
+            count(f"skipped_{name}")
+    if not healthy:
+        logger.warning(f"No healthy source to search '{query}'")
+        return []
+    source_limit = limit * len(SOURCES) // len(healthy)
+
+    # Query every source at once and stop waiting for a slow one once
+    # another source has returned results. Nothing is waited on longer
+    # than the slowest source's budget, counted from submission
+    futures = {
+        _search_pools[name].submit(
+            copy_context().run, run, name, source_limit): name
+        for name in healthy
+    }
+    deadline = time.monotonic() + max(
+        provider_client(name).budget for name in healthy)
+    videos = []
+    pending = set(futures)
+    hedge_until = None
+    while pending:
+        wait_until = min(deadline, hedge_until or deadline)
+        done, pending = wait(
+            pending, timeout=max(0.0, wait_until - time.monotonic()),
+            return_when=FIRST_COMPLETED)
+        if not done:
+            for future in pending:
+                # Searches still queued behind abandoned ones never start
+                future.cancel()
+                logger.warning(
+                    f"[{futures[future].capitalize()}] Still searching "
+                    f"'{query}', moving on")
+                SEARCH_HEDGED.inc(source=futures[future])
+                count(f"hedged_{futures[future]}")
+            break
+        for future in done:
+            results = future.result()
+            videos.extend(results)
+            if results and hedge_until is None:
+                hedge_until = time.monotonic() + HEDGE_DELAY
+
+    return videos
+
+
+@traced("curation")
 def curate_videos(
     keywords: List[str],
-    limit_per_source: int = 5
-) -> List[Video]:
+    limit_per_source: int = 5,
+    search_cache: Optional[SingleFlight] = None
+) -> List[Candidate]:
     logger.info(f"Starting video curation for keywords: {keywords}")
     videos = []
 
     for query in keywords:
-        videos.extend(_pixabay(query, limit_per_source))
-        videos.extend(_pexels(query, limit_per_source))
+        check_cancelled()
+        videos.extend(_search(query, limit_per_source, search_cache))
 
     videos.sort(
         key=lambda v: (
@@ -165,5 +274,8 @@ def curate_videos(
         )
     )
 
+    # Providers often return the same footage for several keywords
+    videos = drop_duplicates(videos)
+
     logger.info(f"Total curated videos: {len(videos)}")
     return videos
@@ -1,65 +1,173 @@
+import hashlib
+import math
 import os
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 from pathlib import Path
 import shutil
 import ffmpeg
-from typing import List
+import pysubs2
+from typing import Dict, List, Optional, Tuple, Union
 
-import requests
+from pydantic import ValidationError
+from app.models.candidate import Candidate
 from app.models.video import Video
+from app.utils.cancellation import (
+    JobCancelled,
+    check_cancelled,
+    current_token,
+)
+from app.utils.checkpoint import run_stage
 from app.utils.logger import setup_logger
+from app.utils.media_scheduler import run_ffmpeg
+from app.utils.metrics import DOWNLOAD_BYTES, count, traced
+from app.utils.provider_client import provider_client
+from app.utils.single_flight import SingleFlight
 
 logger = setup_logger(__name__)
 
+SUBTITLE_MODES = ("burn", "soft", "sidecar")
+
+# aspect ratio -> (width, height, subtitle style)
+OUTPUT_FORMATS = {
+    "16:9": (1280, 720, "FontSize=18,MarginV=20"),
+    "9:16": (720, 1280, "FontSize=12,MarginV=70"),
+    "1:1": (720, 720, "FontSize=14,MarginV=40"),
+}
+DEFAULT_ASPECT_RATIO = "16:9"
+
+# (name, short side, video bitrate, audio bitrate)
+HLS_RENDITIONS = [
+    ("720p", 720, "3000k", "128k"),
+    ("480p", 480, "1400k", "96k"),
+    ("360p", 360, "800k", "64k"),
+]
+HLS_SEGMENT_SECONDS = 4
+# Short live segments let playback start after the first few seconds
+# instead of after the first whole clip
+LIVE_SEGMENT_SECONDS = 2
+
+
+def _as_video(video: Union[Candidate, Video]) -> Optional[Video]:
+    if isinstance(video, Video):
+        return video
+    try:
+        return video.to_video()
+    except ValidationError as e:
+        logger.warning(f"[{video.source.capitalize()}] Skipping invalid "
+                       f"video {video.url}: {e}")
+        return None
+
 
 def _select_videos(
-    videos: List[Video],
+    videos: List[Union[Candidate, Video]],
     duration: float
-):
+) -> List[Video]:
+    # Candidates are validated here, only as far as the selection goes
     selected = []
     total_duration = 0.0
-    for video in videos:
+    overflow = None
+    for candidate in videos:
+        video = _as_video(candidate)
+        if video is None:
+            continue
         if total_duration + video.duration <= duration:
             selected.append(video)
             total_duration += video.duration
         else:
+            overflow = video
             break
 
-    if total_duration < duration:
-        remaining_videos = [v for v in videos if v not in selected]
-        if remaining_videos:
-            selected.append(remaining_videos[0])
-            total_duration += remaining_videos[0].duration
+    if total_duration < duration and overflow is not None:
+        selected.append(overflow)
+        total_duration += overflow.duration
 
     return selected
 
 
+@traced("download.clip")
+def _download_video(video: Video, file_path: str) -> bool:
+    token = current_token()
+    downloaded = 0
+    try:
+        token.check()
+        client = provider_client(
+            f"{video.source}-cdn", timeout=30, budget=60)
+        response = client.get(str(video.url), stream=True)
+        # Closing the response unblocks a read stuck on the socket
+        with token.on_cancel(response.close):
+            response.raise_for_status()
+
+            with open(file_path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=8192):
+                    token.check()
+                    if chunk:
+                        f.write(chunk)
+                        downloaded += len(chunk)
+
+        DOWNLOAD_BYTES.inc(downloaded, source=video.source)
+        count("bytes_downloaded", downloaded)
+
+        return True
+    except JobCancelled:
+        raise
+    except Exception as e:
+        token.check()
+        logger.error(f"Failed to download video {video.url}: {e}")
+        return False
+
+
+@traced("download")
 def _download_videos(
     videos: List[Video],
     output_dir: str
 ) -> List[str]:
-    os.makedirs(output_dir, exist_ok=True)
+    # Kept apart from the re-encoded clips so neither overwrites the other
+    download_dir = os.path.join(output_dir, "downloads")
+    os.makedirs(download_dir, exist_ok=True)
     downloaded_paths = []
 
     for i, video in enumerate(videos):
         file_name = f"{i}.mp4"
-        file_path = os.path.join(output_dir, file_name)
-
-        try:
-            response = requests.get(str(video.url), stream=True, timeout=30)
-            response.raise_for_status()
-
-            with open(file_path, "wb") as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
+        file_path = os.path.join(download_dir, file_name)
 
+        if _download_video(video, file_path):
             downloaded_paths.append(file_path)
-        except Exception as e:
-            logger.error(f"Failed to download video {video.url}: {e}")
 
     return downloaded_paths
 
 
+@traced("reencode.clip")
+def _reencode_video(
+    video_path: str,
+    temp_output: Path,
+    final_output: Path,
+    target_resolution=(1280, 720),
+    target_fps=30
+):
+    vf = (
+        f"scale=w={target_resolution[0]}:h={target_resolution[1]}:force_original_aspect_ratio=decrease,"
+        f"pad={target_resolution[0]}:{target_resolution[1]}:(ow-iw)/2:(oh-ih)/2:color=black"
+    )
+
+    run_ffmpeg(
+        ffmpeg
+        .input(video_path)
+        .output(
+            str(temp_output),
+            vf=vf,
+            r=target_fps,
+            vcodec='libx264',
+            acodec='aac',
+            strict='experimental'
+        )
+        .overwrite_output()
+    )
+
+    shutil.move(str(temp_output), str(final_output))
+
+
+@traced("reencode")
 def _reencode_videos(
     video_paths: List[str],
     output_dir: str,
@@ -73,30 +181,12 @@ def _reencode_videos(
 
     final_paths = []
     for i, video_path in enumerate(video_paths):
+        check_cancelled()
         temp_output = temp_dir / f"temp_{i}.mp4"
         final_output = output_dir / f"{i}.mp4"
 
-        vf = (
-            f"scale=w={target_resolution[0]}:h={target_resolution[1]}:force_original_aspect_ratio=decrease,"
-            f"pad={target_resolution[0]}:{target_resolution[1]}:(ow-iw)/2:(oh-ih)/2:color=black"
-        )
-
-        (
-            ffmpeg
-            .input(video_path)
-            .output(
-                str(temp_output),
-                vf=vf,
-                r=target_fps,
-                vcodec='libx264',
-                acodec='aac',
-                strict='experimental'
-            )
-            .overwrite_output()
-            .run()
-        )
-
-        shutil.move(str(temp_output), str(final_output))
+        _reencode_video(video_path, temp_output, final_output,
+                        target_resolution, target_fps)
         final_paths.append(str(final_output))
 
     try:
@@ -107,6 +197,52 @@ def _reencode_videos(
     return final_paths
 
 
+class ClipCache:
+    # Downloads and normalizes each source clip once for many jobs
+    def __init__(self, cache_dir: str):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._flight = SingleFlight("clip")
+
+    def _build(self, video: Video, key: str) -> Optional[str]:
+        normalized = self.cache_dir / f"{key}.mp4"
+        if normalized.exists():
+            return str(normalized)
+
+        download = self.cache_dir / f"{key}.download"
+        try:
+            if not _download_video(video, str(download)):
+                return None
+            _reencode_video(str(download),
+                            self.cache_dir / f"temp_{key}.mp4", normalized)
+        finally:
+            download.unlink(missing_ok=True)
+        return str(normalized)
+
+    def clip(self, video: Video) -> Optional[str]:
+        key = hashlib.sha1(str(video.url).encode("utf-8")).hexdigest()
+        return self._flight.do(key, lambda: self._build(video, key),
+                               keep=lambda path: path is not None)
+
+
+@traced("shared_clips")
+def _shared_clips(
+    videos: List[Video],
+    output_dir: str,
+    clip_cache: ClipCache
+) -> List[str]:
+    clip_paths = []
+    for video in videos:
+        check_cancelled()
+        cached_path = clip_cache.clip(video)
+        if cached_path is None:
+            continue
+        clip_path = os.path.join(output_dir, f"{len(clip_paths)}.mp4")
+        clip_paths.append(_link_output(cached_path, clip_path))
+    return clip_paths
+
+
+@traced("concatenate")
 def _concatenate_videos(
     video_paths: List[str],
     output_dir: str
@@ -117,44 +253,45 @@ def _concatenate_videos(
         for path in video_paths:
             f.write(f"file '{os.path.abspath(path)}'\n")
 
-    (
+    run_ffmpeg(
         ffmpeg
         .input(list_file, format='concat', safe=0)
-        .output(os.path.join(output_dir, "output.mp4"), c='copy')
+        .output(os.path.join(output_dir, "concatenated.mp4"), c='copy')
         .overwrite_output()
-        .run()
     )
 
     os.remove(list_file)
 
-    return os.path.join(output_dir, "output.mp4")
+    return os.path.join(output_dir, "concatenated.mp4")
 
 
+@traced("voiceover_mix")
 def _burn_voiceover(
     video_path: str,
     voiceover_path: str
 ) -> str:
-    video_path = Path(video_path)
-    temp_output = video_path.with_name(f"temp_{video_path.name}")
+    output_path = Path(video_path).with_name("voiceovered.mp4")
 
     video_in = ffmpeg.input(str(video_path))
     audio_in = ffmpeg.input(str(voiceover_path))
 
-    (
+    run_ffmpeg(
         ffmpeg
-        .output(video_in.video, audio_in.audio, str(temp_output),
-                vcodec='copy', acodec='aac', shortest=None)
+        .output(video_in.video, audio_in.audio, str(output_path),
+                vcodec='copy', acodec='aac', shortest=None,
+                movflags='+faststart')
         .overwrite_output()
-        .run()
     )
 
-    video_path.unlink()
-    temp_output.rename(video_path)
-
-    return str(video_path)
+    return str(output_path)
 
 
-def _burn_subtitle(video_path: str, subtitle_path: str) -> str:
+@traced("subtitle_burn")
+def _burn_subtitle(
+    video_path: str,
+    subtitle_path: str,
+    output_path: str
+) -> str:
     ext = Path(subtitle_path).suffix.lower()
 
     if ext == ".srt":
@@ -165,34 +302,487 @@ def _burn_subtitle(video_path: str, subtitle_path: str) -> str:
         raise ValueError(
             "Unsupported subtitle format. Only .srt and .ass are supported.")
 
-    temp_output = str(Path(video_path).with_name("temp_burned.mp4"))
-
-    (
+    run_ffmpeg(
         ffmpeg
         .input(video_path)
-        .output(temp_output, **filter_args)
+        .output(output_path, movflags='+faststart', **filter_args)
+        .overwrite_output()
+    )
+
+    return output_path
+
+
+@traced("subtitle_mux")
+def _mux_subtitle(
+    video_path: str,
+    subtitle_path: str,
+    output_path: str
+) -> str:
+    video_in = ffmpeg.input(video_path)
+    subtitle_in = ffmpeg.input(subtitle_path)
+
+    run_ffmpeg(
+        ffmpeg
+        .output(video_in.video, video_in.audio, subtitle_in, output_path,
+                vcodec='copy', acodec='copy', scodec='mov_text',
+                movflags='+faststart', **{'metadata:s:s:0': 'language=ind'})
         .overwrite_output()
-        .run()
     )
 
-    Path(video_path).unlink()
-    Path(temp_output).rename(video_path)
+    return output_path
+
+
+def _link_output(video_path: str, output_path: str) -> str:
+    # A hard link publishes the file without copying or moving it
+    if os.path.exists(output_path):
+        os.remove(output_path)
+    try:
+        os.link(video_path, output_path)
+    except OSError:
+        shutil.copyfile(video_path, output_path)
+    return output_path
+
+
+def _export_vtt(subtitle_path: str) -> str:
+    vtt_path = str(Path(subtitle_path).with_suffix(".vtt"))
+    pysubs2.load(subtitle_path).save(vtt_path)
+    return vtt_path
+
 
-    return video_path
+def _format_file_name(aspect_ratio: str) -> str:
+    if aspect_ratio == DEFAULT_ASPECT_RATIO:
+        return "output.mp4"
+    return f"output_{aspect_ratio.replace(':', 'x')}.mp4"
 
 
+def _hls_output(
+    video,
+    audio,
+    hls_dir: str,
+    aspect_ratio: str = DEFAULT_ASPECT_RATIO,
+    renditions=HLS_RENDITIONS,
+    target_fps=30
+):
+    hls_dir = Path(hls_dir)
+    hls_dir.mkdir(parents=True, exist_ok=True)
+
+    # Split the already decoded stream into one scaled branch per rendition
+    videos = video.filter_multi_output("split", len(renditions))
+    audios = audio.filter_multi_output("asplit", len(renditions))
+
+    streams = []
+    bitrates = {}
+    format_width, format_height, _ = OUTPUT_FORMATS[aspect_ratio]
+    for i, (_, short_side, video_bitrate, audio_bitrate) in enumerate(
+            renditions):
+        scale = short_side / min(format_width, format_height)
+        width = round(format_width * scale / 2) * 2
+        height = round(format_height * scale / 2) * 2
+        streams.append(videos[i].filter("scale", width, height))
+        streams.append(audios[i])
+        bitrates[f"b:v:{i}"] = video_bitrate
+        bitrates[f"b:a:{i}"] = audio_bitrate
+
+    var_stream_map = " ".join(
+        f"v:{i},a:{i},name:{name}"
+        for i, (name, *_) in enumerate(renditions)
+    )
+    gop = target_fps * HLS_SEGMENT_SECONDS
+
+    return ffmpeg.output(
+        *streams,
+        str(hls_dir / "stream_%v.m3u8"),
+        format="hls",
+        vcodec="libx264",
+        acodec="aac",
+        preset="veryfast",
+        g=gop,
+        keyint_min=gop,
+        sc_threshold=0,
+        hls_time=HLS_SEGMENT_SECONDS,
+        hls_playlist_type="vod",
+        hls_segment_type="fmp4",
+        hls_flags="independent_segments",
+        hls_fmp4_init_filename="stream_%v_init.mp4",
+        hls_segment_filename=str(hls_dir / "stream_%v_%03d.m4s"),
+        master_pl_name="master.m3u8",
+        var_stream_map=var_stream_map,
+        **bitrates
+    )
+
+
+def _fit_format(video, width: int, height: int):
+    if width * 9 == height * 16:
+        return video.filter("scale", width, height)
+
+    # Cropping 16:9 footage to 9:16 would keep only a narrow centre strip.
+    # Show the whole frame instead, over a blurred fill of the same frame
+    layers = video.filter_multi_output("split", 2)
+    background = (
+        layers[0]
+        .filter("scale", width, height, force_original_aspect_ratio="increase")
+        .filter("crop", width, height)
+        .filter("boxblur", 20)
+    )
+    foreground = layers[1].filter(
+        "scale", width, height, force_original_aspect_ratio="decrease")
+    return ffmpeg.overlay(background, foreground,
+                          x="(W-w)/2", y="(H-h)/2")
+
+
+@traced("render_formats")
+def _render_formats(
+    video_path: str,
+    subtitle_path: str,
+    subtitle_mode: str,
+    aspect_ratios: List[str],
+    hls_dir: Optional[str] = None
+) -> Dict[str, str]:
+    video_path = Path(video_path)
+    source = ffmpeg.input(str(video_path))
+    subtitle_in = ffmpeg.input(subtitle_path)
+
+    def copied(aspect_ratio: str) -> bool:
+        # The intermediate is already 16:9; unless subtitles are burned in,
+        # that branch needs no decode or encode at all
+        return (aspect_ratio == DEFAULT_ASPECT_RATIO
+                and subtitle_mode != "burn")
+
+    # One decode feeds every branch that is cropped, burned or packaged
+    decoded = sum(not copied(aspect_ratio) for aspect_ratio in aspect_ratios)
+    if hls_dir is not None and copied(aspect_ratios[0]):
+        decoded += 1
+    split = (source.video.filter_multi_output("split", decoded)
+             if decoded else None)
+    branches = [split[j] for j in range(decoded)]
+
+    outputs = []
+    paths = {}
+    for i, aspect_ratio in enumerate(aspect_ratios):
+        width, height, subtitle_style = OUTPUT_FORMATS[aspect_ratio]
+        hls = hls_dir is not None and i == 0
+
+        if copied(aspect_ratio):
+            video = source.video
+            vcodec = "copy"
+            if hls:
+                outputs.append(_hls_output(
+                    branches.pop(), source.audio, hls_dir, aspect_ratio))
+        else:
+            video = _fit_format(branches.pop(), width, height)
+            if subtitle_mode == "burn":
+                video = video.filter(
+                    "subtitles", subtitle_path, force_style=subtitle_style)
+            vcodec = "libx264"
+            if hls:
+                # The HLS ladder comes off the same frames as the first
+                # format rather than from a second decode of the finished MP4
+                ladder = video.filter_multi_output("split", 2)
+                video = ladder[0]
+                outputs.append(_hls_output(
+                    ladder[1], source.audio, hls_dir, aspect_ratio))
+
+        streams = [video, source.audio]
+        output_args = {"vcodec": vcodec, "acodec": "copy",
+                       "movflags": "+faststart"}
+        if subtitle_mode == "soft":
+            streams.append(subtitle_in)
+            output_args["scodec"] = "mov_text"
+
+        output_path = video_path.with_name(_format_file_name(aspect_ratio))
+        outputs.append(ffmpeg.output(*streams, str(output_path),
+                                     **output_args))
+        paths[aspect_ratio] = str(output_path)
+
+    run_ffmpeg(ffmpeg.merge_outputs(*outputs).overwrite_output())
+
+    return paths
+
+
+@traced("process_video")
 def process_video(
-    videos: List[Video],
+    videos: List[Union[Candidate, Video]],
     output_dir: str,
     voiceover_path: str,
     subtitle_path: str,
-    duration: float
+    duration: float,
+    subtitle_mode: str = "burn",
+    streaming: bool = False,
+    aspect_ratios: Optional[List[str]] = None,
+    clip_cache: Optional[ClipCache] = None
 ):
+    aspect_ratios = aspect_ratios or [DEFAULT_ASPECT_RATIO]
+    if subtitle_mode not in SUBTITLE_MODES:
+        raise ValueError(
+            f"Unsupported subtitle mode '{subtitle_mode}'. "
+            f"Choose one of: {', '.join(SUBTITLE_MODES)}.")
+    for aspect_ratio in aspect_ratios:
+        if aspect_ratio not in OUTPUT_FORMATS:
+            raise ValueError(
+                f"Unsupported aspect ratio '{aspect_ratio}'. "
+                f"Choose from: {', '.join(OUTPUT_FORMATS)}.")
+
+    hls_dir = os.path.join(output_dir, "hls") if streaming else None
+
+    def finalize(voiceovered_path: str) -> Dict[str, str]:
+        if subtitle_mode == "sidecar":
+            _export_vtt(subtitle_path)
+
+        if streaming or aspect_ratios != [DEFAULT_ASPECT_RATIO]:
+            return _render_formats(
+                voiceovered_path, subtitle_path, subtitle_mode, aspect_ratios,
+                hls_dir=hls_dir)
+
+        output_path = os.path.join(
+            output_dir, _format_file_name(DEFAULT_ASPECT_RATIO))
+        if subtitle_mode == "burn":
+            _burn_subtitle(voiceovered_path, subtitle_path, output_path)
+        elif subtitle_mode == "soft":
+            _mux_subtitle(voiceovered_path, subtitle_path, output_path)
+        else:
+            _link_output(voiceovered_path, output_path)
+        return {DEFAULT_ASPECT_RATIO: output_path}
+
+    # Every stage is checkpointed in the job manifest, so a retry of the
+    # same job only redoes the stages whose outputs are missing or stale
     selected_videos = _select_videos(videos, duration)
-    downloaded_paths = _download_videos(selected_videos, output_dir)
-    reencoded_paths = _reencode_videos(downloaded_paths, output_dir)
-    concatenated_path = _concatenate_videos(reencoded_paths, output_dir)
-    voiceovered_path = _burn_voiceover(concatenated_path, voiceover_path)
-    output_path = _burn_subtitle(voiceovered_path, subtitle_path)
+    if clip_cache is not None:
+        reencoded_paths = run_stage(
+            output_dir, "shared_clips",
+            lambda: _shared_clips(selected_videos, output_dir, clip_cache),
+            outputs=lambda paths: paths,
+            inputs={"urls": [str(video.url) for video in selected_videos]},
+            complete=lambda paths: len(paths) == len(selected_videos))
+    else:
+        downloaded_paths = run_stage(
+            output_dir, "download",
+            lambda: _download_videos(selected_videos, output_dir),
+            outputs=lambda paths: paths,
+            inputs={"urls": [str(video.url) for video in selected_videos]},
+            complete=lambda paths: len(paths) == len(selected_videos))
+        reencoded_paths = run_stage(
+            output_dir, "reencode",
+            lambda: _reencode_videos(downloaded_paths, output_dir),
+            outputs=lambda paths: paths,
+            input_files=downloaded_paths)
+    concatenated_path = run_stage(
+        output_dir, "concatenate",
+        lambda: _concatenate_videos(reencoded_paths, output_dir),
+        outputs=lambda path: [path],
+        input_files=reencoded_paths)
+    voiceovered_path = run_stage(
+        output_dir, "voiceover",
+        lambda: _burn_voiceover(concatenated_path, voiceover_path),
+        outputs=lambda path: [path],
+        input_files=[concatenated_path, voiceover_path])
+    output_paths = run_stage(
+        output_dir, "finalize",
+        lambda: finalize(voiceovered_path),
+        outputs=lambda paths: list(paths.values()) + (
+            [os.path.join(hls_dir, "master.m3u8")] if streaming else []),
+        inputs={"subtitle_mode": subtitle_mode,
+                "aspect_ratios": aspect_ratios,
+                "streaming": streaming},
+        input_files=[voiceovered_path, subtitle_path])
+
+    return output_paths, reencoded_paths
+
+
+def _plan_timeline(
+    videos: List[Video],
+    duration: float
+) -> List[Tuple[Video, float, float]]:
+    timeline = []
+    start = 0.0
+    for i, video in enumerate(videos):
+        length = video.duration or 0.0
+        if i == len(videos) - 1 or start + length > duration:
+            # Last slot fills (or trims to) whatever narration is left
+            length = duration - start
+        if length <= 0:
+            break
+        timeline.append((video, start, length))
+        start += length
+    return timeline
+
+
+def _slice_subtitle(
+    subtitle_path: str,
+    start: float,
+    length: float,
+    output_path: str
+) -> Optional[str]:
+    subs = pysubs2.load(subtitle_path)
+    subs.shift(ms=-int(start * 1000))
+    subs.events = [
+        event for event in subs.events
+        if event.end > 0 and event.start < length * 1000
+    ]
+    if not subs.events:
+        return None
+
+    for event in subs.events:
+        event.start = max(event.start, 0)
+        event.end = min(event.end, int(length * 1000))
+
+    subs.save(output_path)
+    return output_path
+
+
+@traced("segment")
+def _render_segment(
+    clip_path: str,
+    voiceover_path: str,
+    subtitle_path: Optional[str],
+    start: float,
+    length: float,
+    segment_prefix: str,
+    target_resolution=(1280, 720),
+    target_fps=30
+) -> List[Tuple[str, float]]:
+    width, height = target_resolution
+
+    # Loop short clips so every segment covers its whole timeline slot
+    video_in = ffmpeg.input(clip_path, stream_loop=-1, t=length)
+    audio_in = ffmpeg.input(voiceover_path, ss=start, t=length)
+
+    video = (
+        video_in.video
+        .filter("scale", w=width, h=height,
+                force_original_aspect_ratio="decrease")
+        .filter("pad", width, height, "(ow-iw)/2", "(oh-ih)/2",
+                color="black")
+        .filter("fps", fps=target_fps)
+    )
+    if subtitle_path:
+        video = video.filter("subtitles", subtitle_path)
+
+    # The slot is cut into fixed-length pieces, each starting on a forced
+    # keyframe; only the slot's last piece can be shorter
+    list_path = f"{segment_prefix}.csv"
+    run_ffmpeg(
+        ffmpeg
+        .output(
+            video, audio_in.audio, f"{segment_prefix}_%03d.ts",
+            format="segment",
+            segment_format="mpegts",
+            segment_time=LIVE_SEGMENT_SECONDS,
+            segment_list=list_path,
+            segment_list_type="csv",
+            force_key_frames=(
+                f"expr:gte(t,n_forced*{LIVE_SEGMENT_SECONDS})"),
+            vcodec="libx264",
+            acodec="aac",
+            preset="veryfast",
+            sc_threshold=0,
+            t=length,
+            initial_offset=start
+        )
+        .overwrite_output()
+    )
+
+    segments = []
+    directory = Path(segment_prefix).parent
+    for line in Path(list_path).read_text().splitlines():
+        name, segment_start, segment_end = line.rsplit(",", 2)
+        segments.append((
+            str(directory / name),
+            float(segment_end) - float(segment_start)))
+    return segments
+
+
+def _write_live_playlist(
+    playlist_path: Path,
+    segments: List[Tuple[str, float]],
+    target_duration: float,
+    ended: bool
+):
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:3",
+        "#EXT-X-PLAYLIST-TYPE:EVENT",
+        f"#EXT-X-TARGETDURATION:{math.ceil(target_duration)}",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+    ]
+    for name, length in segments:
+        lines.append(f"#EXTINF:{length:.3f},")
+        lines.append(name)
+    if ended:
+        lines.append("#EXT-X-ENDLIST")
+
+    # Players poll this file, so never expose a half-written playlist
+    temp_path = playlist_path.with_suffix(".tmp")
+    temp_path.write_text("\n".join(lines) + "\n")
+    os.replace(temp_path, playlist_path)
+
+
+@traced("process_video_progressive")
+def process_video_progressive(
+    videos: List[Union[Candidate, Video]],
+    output_dir: str,
+    voiceover_path: str,
+    subtitle_path: str,
+    duration: float,
+    max_downloads: int = 4
+):
+    output_dir = Path(output_dir)
+    segments_dir = output_dir / "segments"
+    segments_dir.mkdir(parents=True, exist_ok=True)
+    playlist_path = output_dir / "live.m3u8"
+
+    timeline = _plan_timeline(_select_videos(videos, duration), duration)
+    if not timeline:
+        raise RuntimeError("No videos available to fill the timeline")
+
+    target_duration = LIVE_SEGMENT_SECONDS
+    _write_live_playlist(playlist_path, [], target_duration, ended=False)
+
+    published = []
+    segment_paths = []
+    try:
+        with ThreadPoolExecutor(max_workers=max_downloads) as executor:
+            downloads = [
+                executor.submit(copy_context().run, _download_video, video,
+                                str(segments_dir / f"clip_{i}.mp4"))
+                for i, (video, _, _) in enumerate(timeline)
+            ]
+
+            # Render in timeline order, each as soon as its clip has arrived
+            for i, (_, start, length) in enumerate(timeline):
+                clip_path = segments_dir / f"clip_{i}.mp4"
+                check_cancelled()
+                if not downloads[i].result():
+                    raise RuntimeError(f"Clip {i} could not be downloaded")
+
+                segment_subtitle = _slice_subtitle(
+                    subtitle_path, start, length,
+                    str(segments_dir / f"segment_{i:03d}.srt"))
+                segments = _render_segment(
+                    str(clip_path), voiceover_path, segment_subtitle,
+                    start, length, str(segments_dir / f"segment_{i:03d}"))
+
+                segment_paths.extend(path for path, _ in segments)
+                published.extend(
+                    (f"segments/{Path(path).name}", segment_length)
+                    for path, segment_length in segments)
+                _write_live_playlist(
+                    playlist_path, published, target_duration,
+                    ended=i == len(timeline) - 1)
+                logger.info(f"Published segment {i + 1}/{len(timeline)}")
+    except BaseException:
+        # End the playlist early so players stop polling a dead job
+        _write_live_playlist(
+            playlist_path, published, target_duration, ended=True)
+        raise
+
+    # Stitch the published segments into a regular MP4 for download
+    output_path = output_dir / "output.mp4"
+    run_ffmpeg(
+        ffmpeg
+        .input(f"concat:{'|'.join(segment_paths)}")
+        .output(str(output_path), c="copy", movflags="+faststart",
+                **{"bsf:a": "aac_adtstoasc"})
+        .overwrite_output()
+    )
 
-    return output_path, reencoded_paths
+    return str(playlist_path), str(output_path), segment_paths
@@ -1,15 +1,21 @@
+from functools import lru_cache
 from pathlib import Path
 import re
-from pydub import AudioSegment
+import threading
+from typing import TYPE_CHECKING
 from num2words import num2words
-from g2p_id import G2P
-from TTS.api import TTS
+from app.utils.metrics import traced
 from app.utils.constant import (
     TTS_MODEL_PATH,
     TTS_CONFIG_PATH,
     TTS_SPEAKERS_PATH,
 )
 
+# g2p_id, TTS and pydub are imported on first use; they take seconds to load
+if TYPE_CHECKING:
+    from g2p_id import G2P
+    from TTS.api import TTS
+
 SYMBOL_MAP = {
     " + ": " plus ",
     " - ": " minus ",
@@ -20,7 +26,31 @@ SYMBOL_MAP = {
 
 DEFAULT_SPEAKER = "wibowo"
 
+# Coqui models are not safe to run from several threads at once
+_tts_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def _load_g2p() -> "G2P":
+    from g2p_id import G2P
+
+    return G2P()
+
+
+@lru_cache(maxsize=1)
+def _load_tts() -> "TTS":
+    from TTS.api import TTS
 
+    return TTS(config_path=TTS_CONFIG_PATH, model_path=TTS_MODEL_PATH,
+               speakers_file_path=TTS_SPEAKERS_PATH)
+
+
+def warm_up():
+    _load_g2p()
+    _load_tts()
+
+
+@traced("tts.preprocess")
 def _preprocess_text(text: str) -> str:
     for symbol, word in SYMBOL_MAP.items():
         text = text.replace(symbol, word)
@@ -29,17 +59,19 @@ def _preprocess_text(text: str) -> str:
     text = re.sub(r'\d+', lambda m: num2words(int(m.group()), lang="id"), text)
 
     # Convert text to phonetics using G2P
-    phonetic_text = G2P()(text)
+    phonetic_text = _load_g2p()(text)
     return phonetic_text
 
 
+@traced("tts.synthesize")
 def _coqui(text: str, output_path: str) -> str:
-    tts = TTS(config_path=TTS_CONFIG_PATH, model_path=TTS_MODEL_PATH,
-              speakers_file_path=TTS_SPEAKERS_PATH)
-    tts.tts_to_file(text=text, file_path=output_path,
-                    speaker=DEFAULT_SPEAKER)
+    tts = _load_tts()
+    with _tts_lock:
+        tts.tts_to_file(text=text, file_path=output_path,
+                        speaker=DEFAULT_SPEAKER)
 
 
+@traced("tts")
 def generate_voiceover(text: str, output_dir: str) -> tuple[str, float]:
     processed_text = _preprocess_text(text)
     output_dir_path = Path(output_dir)
@@ -47,6 +79,8 @@ def generate_voiceover(text: str, output_dir: str) -> tuple[str, float]:
 
     _coqui(processed_text, output_path)
 
+    from pydub import AudioSegment
+
     audio = AudioSegment.from_file(output_path)
     duration = len(audio) / 1000  # in seconds
 
@@ -0,0 +1,108 @@
+import os
+import shutil
+import subprocess
+import threading
+import uuid
+from typing import Callable, Dict, List
+from app.utils import keywords_extractor, subtitle_generator
+from app.utils import voiceover_generator
+from app.utils.constant import STORAGE_DIR
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+COMPONENTS: Dict[str, Callable[[], None]] = {
+    "tts": voiceover_generator.warm_up,
+    "asr": subtitle_generator.warm_up,
+    "keywords": keywords_extractor.warm_up,
+}
+
+# WARMUP: comma separated components to preload at startup, or "none"
+DEFAULT_WARMUP = "tts,asr,keywords"
+
+_status: Dict[str, str] = {}
+_status_lock = threading.Lock()
+_ffmpeg_ok = False
+
+
+def _components() -> List[str]:
+    warmup = os.getenv("WARMUP", DEFAULT_WARMUP)
+    names = [name.strip() for name in warmup.split(",") if name.strip()]
+    if names == ["none"]:
+        return []
+    unknown = [name for name in names if name not in COMPONENTS]
+    if unknown:
+        raise ValueError(
+            f"Unsupported warm-up component(s) {', '.join(unknown)}. "
+            f"Choose from: {', '.join(COMPONENTS)}.")
+    return names
+
+
+def _set_status(name: str, status: str):
+    with _status_lock:
+        _status[name] = status
+
+
+def _run(names: List[str]):
+    for name in names:
+        _set_status(name, "loading")
+        try:
+            COMPONENTS[name]()
+            _set_status(name, "ready")
+            logger.info(f"Warm-up of '{name}' finished")
+        except Exception as e:
+            _set_status(name, f"failed: {e}")
+            logger.error(f"Warm-up of '{name}' failed: {e}")
+
+
+def start_warmup() -> threading.Thread:
+    # Models load in the background so the app answers /healthz at once
+    names = _components()
+    for name in names:
+        _set_status(name, "pending")
+    thread = threading.Thread(
+        target=_run, args=(names,), name="warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def warmup_status() -> Dict[str, str]:
+    with _status_lock:
+        return dict(_status)
+
+
+def ffmpeg_available() -> bool:
+    global _ffmpeg_ok
+    if not _ffmpeg_ok and shutil.which("ffmpeg"):
+        try:
+            subprocess.run(["ffmpeg", "-version"], capture_output=True,
+                           check=True, timeout=10)
+            _ffmpeg_ok = True
+        except (OSError, subprocess.SubprocessError):
+            pass
+    return _ffmpeg_ok
+
+
+def storage_writable() -> bool:
+    probe = STORAGE_DIR / f".readyz_{uuid.uuid4().hex}"
+    try:
+        STORAGE_DIR.mkdir(parents=True, exist_ok=True)
+        probe.write_bytes(b"ok")
+        probe.unlink()
+        return True
+    except OSError:
+        return False
+
+
+def readiness() -> dict:
+    models = warmup_status()
+    checks = {
+        "models": all(status == "ready" for status in models.values()),
+        "ffmpeg": ffmpeg_available(),
+        "storage": storage_writable(),
+    }
+    return {
+        "ready": all(checks.values()),
+        "checks": checks,
+        "models": models,
+    }
@@ -0,0 +1,246 @@
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+import ffmpeg
+
+CLIP_SECONDS = 5
+CLIP_SIZE = (1280, 720)
+THUMBNAIL_SIZE = (640, 360)
+CATALOG_SIZE = 32
+CHUNK_SIZE = 64 * 1024
+
+# Words used for the tags/slugs of the fake catalog
+TAGS = ["sawah", "gunung", "pantai", "kota", "hutan", "sungai", "desa",
+        "langit", "laut", "jalan", "pasar", "kebun"]
+
+
+# Each source has its own catalog, as the real providers do
+SOURCES = ("pixabay", "pexels")
+
+
+def _clip_seed(source: str, index: int) -> int:
+    # Content follows from the clip's URL path alone, never from the order
+    # clips were generated or requested in
+    digest = hashlib.sha1(f"{source}/{index}".encode()).digest()
+    return int.from_bytes(digest[:4], "big")
+
+
+def _generate_clip(seed: int, clip_path: Path, thumbnail_path: Path):
+    # A seeded Game of Life gives every clip (and thumbnail) distinct content
+    width, height = CLIP_SIZE
+    source = ffmpeg.input(
+        f"life=s={width // 4}x{height // 4}:seed={seed}:rate=30"
+        f":mold=10:life_color=#{seed % 0xFFFFFF:06x}",
+        f="lavfi", t=CLIP_SECONDS)
+    video = source.filter("scale", width, height, flags="neighbor")
+    (
+        ffmpeg
+        .output(video, str(clip_path), vcodec="libx264", preset="ultrafast",
+                pix_fmt="yuv420p", movflags="+faststart")
+        .global_args("-loglevel", "error")
+        .overwrite_output()
+        .run()
+    )
+    (
+        ffmpeg
+        .input(str(clip_path))
+        .filter("scale", *THUMBNAIL_SIZE)
+        .output(str(thumbnail_path), vframes=1)
+        .global_args("-loglevel", "error")
+        .overwrite_output()
+        .run()
+    )
+
+
+def build_catalog(work_dir: Path, size: int = CATALOG_SIZE) -> Path:
+    catalog_dir = work_dir / "catalog"
+    for source in SOURCES:
+        source_dir = catalog_dir / source
+        source_dir.mkdir(parents=True, exist_ok=True)
+        for index in range(size):
+            clip_path = source_dir / f"{index}.mp4"
+            thumbnail_path = source_dir / f"{index}.jpg"
+            if not clip_path.exists() or not thumbnail_path.exists():
+                _generate_clip(
+                    _clip_seed(source, index), clip_path, thumbnail_path)
+    return catalog_dir
+
+
+class FakeProviders:
+    # Serves Pixabay/Pexels shaped search results plus the clips and
+    # thumbnails they point to, all from synthetic files on disk
+    def __init__(
+        self,
+        work_dir: Path,
+        catalog_size: int = CATALOG_SIZE,
+        search_latency: float = 0.0,
+        cdn_bytes_per_second: Optional[float] = None
+    ):
+        self.catalog_dir = build_catalog(work_dir, catalog_size)
+        self.catalog_size = catalog_size
+        self.search_latency = search_latency
+        self.cdn_bytes_per_second = cdn_bytes_per_second
+        # Duration advertised in search results, which is what the
+        # pipeline uses to decide how many clips to select
+        self.reported_duration = float(CLIP_SECONDS)
+        self.requests = {"pixabay": 0, "pexels": 0, "cdn": 0}
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def env(self) -> dict:
+        return {
+            "PIXABAY_API_KEY": "benchmark",
+            "PIXABAY_BASE_URL": f"{self.base_url}/pixabay/",
+            "PEXELS_API_KEY": "benchmark",
+            "PEXELS_BASE_URL": f"{self.base_url}/pexels/",
+        }
+
+    def _count(self, name: str):
+        with self._lock:
+            self.requests[name] += 1
+
+    def _pick(self, source: str, query: str, limit: int):
+        # The slice of the catalog comes from the (source, query) itself, so
+        # every run returns the same clips whatever order searches arrive in
+        digest = hashlib.sha1(f"{source}:{query}".encode()).digest()
+        offset = int.from_bytes(digest[:4], "big") % self.catalog_size
+        return [(offset + i) % self.catalog_size for i in range(limit)]
+
+    def cdn_url(self, source: str, index: int, extension: str) -> str:
+        return f"{self.base_url}/cdn/{source}/{index}.{extension}"
+
+    def _item_id(self, source: str, query: str, index: int) -> int:
+        digest = hashlib.sha1(f"{source}:{query}:{index}".encode()).digest()
+        return int.from_bytes(digest[:3], "big")
+
+    def pixabay(self, query: str, limit: int) -> dict:
+        hits = []
+        for index in self._pick("pixabay", query, limit):
+            width, height = CLIP_SIZE
+            tags = ", ".join(TAGS[(index + k) % len(TAGS)] for k in range(3))
+            hits.append({
+                "id": self._item_id("pixabay", query, index),
+                "tags": f"{query}, {tags}",
+                "duration": self.reported_duration,
+                "videos": {
+                    "medium": {
+                        "url": self.cdn_url("pixabay", index, "mp4"),
+                        "width": width,
+                        "height": height,
+                        "thumbnail": self.cdn_url("pixabay", index, "jpg"),
+                    },
+                },
+            })
+        return {"total": len(hits), "totalHits": len(hits), "hits": hits}
+
+    def pexels(self, query: str, limit: int) -> dict:
+        videos = []
+        for index in self._pick("pexels", query, limit):
+            width, height = CLIP_SIZE
+            item_id = self._item_id("pexels", query, index)
+            slug = "-".join(query.split() + [TAGS[index % len(TAGS)]])
+            videos.append({
+                "id": item_id,
+                "url": f"https://www.pexels.com/video/{slug}-{item_id}/",
+                "duration": self.reported_duration,
+                "width": width,
+                "height": height,
+                "image": self.cdn_url("pexels", index, "jpg"),
+                "video_files": [{
+                    "link": self.cdn_url("pexels", index, "mp4"),
+                    "width": width,
+                    "height": height,
+                }],
+            })
+        return {"page": 1, "per_page": limit, "videos": videos}
+
+    def _handler(self):
+        providers = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, payload: dict):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_file(self, path: Path, content_type: str):
+                if not path.is_file():
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(path.stat().st_size))
+                self.end_headers()
+                with open(path, "rb") as f:
+                    while chunk := f.read(CHUNK_SIZE):
+                        self.wfile.write(chunk)
+                        if providers.cdn_bytes_per_second:
+                            time.sleep(
+                                len(chunk) / providers.cdn_bytes_per_second)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+
+                if url.path.startswith("/cdn/"):
+                    providers._count("cdn")
+                    path = Path(url.path)
+                    if path.parent.name not in SOURCES:
+                        self.send_error(404)
+                        return
+                    content_type = ("image/jpeg" if path.suffix == ".jpg"
+                                    else "video/mp4")
+                    self._send_file(
+                        providers.catalog_dir / path.parent.name / path.name,
+                        content_type)
+                    return
+
+                time.sleep(providers.search_latency)
+                if url.path == "/pixabay/":
+                    providers._count("pixabay")
+                    self._send_json(providers.pixabay(
+                        params.get("q", ""), int(params.get("per_page", 5))))
+                elif url.path == "/pexels/search":
+                    providers._count("pexels")
+                    self._send_json(providers.pexels(
+                        params.get("query", ""),
+                        int(params.get("per_page", 5))))
+                else:
+                    self.send_error(404)
+
+        return Handler
+
+    def start(self) -> "FakeProviders":
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever,
+                         name="fake-providers", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "FakeProviders":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
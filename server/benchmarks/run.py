@@ -0,0 +1,420 @@
+# Offline benchmarks for the generation pipeline.
+#
+# Run from the server directory:
+#   python -m benchmarks.run --suite all --output results.json
+#
+# Pixabay/Pexels are replaced by a local fake server, keyword extraction by
+# a fixed list and (unless --real-tts/--real-asr) TTS/ASR by stubs, so the
+# numbers only depend on this machine and the code under test.
+import argparse
+import json
+import math
+import os
+import platform
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+import ffmpeg
+import requests
+from benchmarks import stubs, workloads
+from benchmarks.fake_providers import CLIP_SECONDS, CLIP_SIZE, FakeProviders
+
+STAGES = ["download", "reencode", "concatenate", "voiceover_mix",
+          "subtitle_burn", "render_formats", "hls"]
+# Minimum similarity between a format's fitted area and the 16:9 source
+SSIM_THRESHOLD = 0.8
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    # Nearest-rank percentile
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def _cpu_seconds() -> float:
+    # ffmpeg children only show up here once reaped, which the scheduler
+    # does before run_ffmpeg returns
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+
+def _summarize(
+    latencies: List[float],
+    errors: int,
+    wall_seconds: float,
+    cpu_seconds: float
+) -> dict:
+    return {
+        "runs": len(latencies) + errors,
+        "errors": errors,
+        "wall_seconds": wall_seconds,
+        "throughput_per_second": (
+            len(latencies) / wall_seconds if wall_seconds else None),
+        "latency_p50": _percentile(latencies, 50),
+        "latency_p95": _percentile(latencies, 95),
+        "latency_max": max(latencies) if latencies else None,
+        "cpu_seconds": cpu_seconds,
+    }
+
+
+def _environment() -> dict:
+    def command_output(*command) -> str:
+        try:
+            return subprocess.run(
+                command, capture_output=True, text=True, check=True
+            ).stdout.splitlines()[0]
+        except Exception:
+            return None
+
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "commit": command_output("git", "rev-parse", "HEAD"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "ffmpeg": command_output("ffmpeg", "-version"),
+        "ffmpeg_slots": os.getenv("FFMPEG_SLOTS"),
+    }
+
+
+def _catalog_videos(providers: FakeProviders, count: int):
+    from app.models.video import Video
+
+    width, height = CLIP_SIZE
+    return [
+        Video(
+            source="pixabay",
+            keyword="benchmark",
+            description="benchmark clip",
+            url=providers.cdn_url(
+                "pixabay", i % providers.catalog_size, "mp4"),
+            duration=CLIP_SECONDS,
+            width=width,
+            height=height,
+            thumbnail=providers.cdn_url(
+                "pixabay", i % providers.catalog_size, "jpg"),
+            similarity_score=0.0
+        )
+        for i in range(count)
+    ]
+
+
+def _check_formats(source_path: str, paths: Dict[str, str]):
+    # Every format must have its size and show the whole 16:9 frame, not a
+    # cropped strip: the fitted area is scaled back and compared with SSIM
+    from app.utils.videos_processor import OUTPUT_FORMATS
+
+    source_width, source_height = CLIP_SIZE
+    for aspect_ratio, path in paths.items():
+        width, height, _ = OUTPUT_FORMATS[aspect_ratio]
+        video = next(stream for stream in ffmpeg.probe(path)["streams"]
+                     if stream["codec_type"] == "video")
+        if (video["width"], video["height"]) != (width, height):
+            raise RuntimeError(
+                f"{aspect_ratio} output is {video['width']}x"
+                f"{video['height']}, expected {width}x{height}")
+
+        scale = min(width / source_width, height / source_height)
+        fit_width = round(source_width * scale)
+        fit_height = round(source_height * scale)
+        shown = (
+            ffmpeg.input(path).video
+            .filter("crop", fit_width, fit_height,
+                    (width - fit_width) // 2, (height - fit_height) // 2)
+            .filter("scale", source_width, source_height)
+        )
+        args = (
+            ffmpeg.filter([shown, ffmpeg.input(source_path).video], "ssim")
+            .output("-", f="null")
+            .global_args("-hide_banner")
+            .compile()
+        )
+        stderr = subprocess.run(args, capture_output=True, text=True).stderr
+        match = re.search(r"All:([\d.]+)", stderr)
+        if match is None or float(match.group(1)) < SSIM_THRESHOLD:
+            raise RuntimeError(
+                f"{aspect_ratio} output does not show the full frame "
+                f"(SSIM {match.group(1) if match else 'n/a'})")
+
+
+def bench_stages(
+    providers: FakeProviders,
+    work_dir: Path,
+    clip_counts: List[int],
+    iterations: int
+) -> List[dict]:
+    from app.utils import videos_processor
+
+    results = []
+    for clips in clip_counts:
+        videos = _catalog_videos(providers, clips)
+        # Narration as long as the clips, like a real job would select
+        text = " ".join(
+            ["kata"] * int(clips * CLIP_SECONDS * stubs.WORDS_PER_SECOND))
+
+        timings: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+        cpu: Dict[str, float] = {stage: 0.0 for stage in STAGES}
+        errors = 0
+        for iteration in range(iterations):
+            job_dir = work_dir / "stages" / f"{clips}_{iteration}"
+            job_dir.mkdir(parents=True, exist_ok=True)
+            voiceover_path, _ = stubs.stub_voiceover(text, str(job_dir))
+            subtitle_path = stubs.stub_subtitle(
+                voiceover_path, text, str(job_dir))
+
+            state = {}
+            steps = {
+                "download": lambda: videos_processor._download_videos(
+                    videos, str(job_dir)),
+                "reencode": lambda: videos_processor._reencode_videos(
+                    state["download"], str(job_dir)),
+                "concatenate": lambda: videos_processor._concatenate_videos(
+                    state["reencode"], str(job_dir)),
+                "voiceover_mix": lambda: videos_processor._burn_voiceover(
+                    state["concatenate"], voiceover_path),
+                "subtitle_burn": lambda: videos_processor._burn_subtitle(
+                    state["voiceover_mix"], subtitle_path,
+                    str(job_dir / "output.mp4")),
+                "render_formats": lambda: videos_processor._render_formats(
+                    state["voiceover_mix"], subtitle_path, "burn",
+                    workloads.ASPECT_RATIOS),
+                "hls": lambda: videos_processor._render_formats(
+                    state["voiceover_mix"], subtitle_path, "burn",
+                    [workloads.ASPECT_RATIOS[0]],
+                    hls_dir=str(job_dir / "hls")),
+            }
+            try:
+                for stage in STAGES:
+                    cpu_start = _cpu_seconds()
+                    start = time.perf_counter()
+                    state[stage] = steps[stage]()
+                    timings[stage].append(time.perf_counter() - start)
+                    cpu[stage] += _cpu_seconds() - cpu_start
+                    if stage == "render_formats":
+                        _check_formats(state["voiceover_mix"], state[stage])
+            except Exception as e:
+                errors += 1
+                print(f"[stages] {clips} clips, iteration {iteration} "
+                      f"failed: {e}", file=sys.stderr)
+            finally:
+                shutil.rmtree(job_dir, ignore_errors=True)
+
+        for stage in STAGES:
+            results.append({
+                "suite": "stages",
+                "stage": stage,
+                "clips": clips,
+                **_summarize(timings[stage], errors,
+                             sum(timings[stage]), cpu[stage]),
+            })
+            print(f"[stages] {stage} x{clips} clips: "
+                  f"p50 {results[-1]['latency_p50']}", file=sys.stderr)
+
+    return results
+
+
+def _start_app(main_module, port: int):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(
+        main_module.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="benchmark-app",
+                              daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("Benchmark app failed to start")
+        time.sleep(0.05)
+    return server, thread
+
+
+def _free_port() -> int:
+    import socket
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def bench_pipeline(
+    providers: FakeProviders,
+    script_names: List[str],
+    clip_counts: List[int],
+    concurrency_levels: List[int],
+    iterations: int,
+    real_tts: bool = False,
+    real_asr: bool = False,
+    keep_outputs: bool = False
+) -> List[dict]:
+    # Imported here so load_dotenv in app.main runs before the fake
+    # provider URLs are put in the environment, not after
+    import app.main as main
+    from app.utils.constant import STORAGE_DIR
+
+    os.environ.update(providers.env())
+    # Preloading Coqui and Whisper would skew the timings and go online
+    os.environ["WARMUP"] = "none"
+    restore = stubs.install(main, tts=not real_tts, asr=not real_asr)
+    port = _free_port()
+    server, thread = _start_app(main, port)
+    url = f"http://127.0.0.1:{port}/generate"
+
+    def generate(text: str):
+        start = time.perf_counter()
+        response = requests.post(url, json={"text": text})
+        elapsed = time.perf_counter() - start
+        job_id = None
+        if response.ok:
+            video_url = response.json()["result"]["video"]["url"]
+            job_id = Path(urlparse(video_url).path).parent.name
+        return response.ok, elapsed, job_id
+
+    results = []
+    try:
+        for script_name in script_names:
+            text = workloads.SCRIPTS[script_name]
+            duration = stubs.script_duration(text)
+            for clips in clip_counts:
+                # Advertise clips just longer than duration / clips so
+                # selection picks exactly `clips` of them
+                providers.reported_duration = duration / clips * 1.001
+                for concurrency in concurrency_levels:
+                    latencies, errors, job_ids = [], 0, []
+                    cpu_start = _cpu_seconds()
+                    start = time.perf_counter()
+                    with ThreadPoolExecutor(concurrency) as pool:
+                        outcomes = pool.map(
+                            generate, [text] * (iterations * concurrency))
+                        for ok, elapsed, job_id in outcomes:
+                            if ok:
+                                latencies.append(elapsed)
+                                job_ids.append(job_id)
+                            else:
+                                errors += 1
+                    wall_seconds = time.perf_counter() - start
+                    cpu_seconds = _cpu_seconds() - cpu_start
+
+                    results.append({
+                        "suite": "pipeline",
+                        "script": script_name,
+                        "clips": clips,
+                        "concurrency": concurrency,
+                        **_summarize(latencies, errors, wall_seconds,
+                                     cpu_seconds),
+                    })
+                    print(f"[pipeline] {script_name}, {clips} clips, "
+                          f"concurrency {concurrency}: "
+                          f"p50 {results[-1]['latency_p50']}",
+                          file=sys.stderr)
+
+                    if not keep_outputs:
+                        for job_id in job_ids:
+                            shutil.rmtree(STORAGE_DIR / job_id,
+                                          ignore_errors=True)
+    finally:
+        server.should_exit = True
+        thread.join()
+        restore()
+
+    return results
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Offline benchmarks for the flikee pipeline.")
+    parser.add_argument("--suite", choices=["pipeline", "stages", "all"],
+                        default="all")
+    parser.add_argument("--scripts", default=",".join(workloads.SCRIPTS),
+                        help="comma separated script names")
+    parser.add_argument("--clips", type=_int_list,
+                        default=workloads.CLIP_COUNTS)
+    parser.add_argument("--concurrency", type=_int_list,
+                        default=workloads.CONCURRENCY)
+    parser.add_argument("--iterations", type=int,
+                        default=workloads.ITERATIONS)
+    parser.add_argument("--work-dir", type=Path,
+                        help="keeps the synthetic catalog between runs")
+    parser.add_argument("--search-latency", type=float, default=0.0,
+                        help="seconds added to every fake search")
+    parser.add_argument("--cdn-rate", type=float,
+                        help="fake CDN throughput in bytes per second")
+    parser.add_argument("--real-tts", action="store_true")
+    parser.add_argument("--real-asr", action="store_true")
+    parser.add_argument("--keep-outputs", action="store_true")
+    parser.add_argument("--output", type=Path,
+                        help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    temp_dir = None
+    work_dir = args.work_dir
+    if work_dir is None:
+        temp_dir = tempfile.mkdtemp(prefix="flikee_bench_")
+        work_dir = Path(temp_dir)
+
+    results = []
+    try:
+        with FakeProviders(
+            work_dir,
+            search_latency=args.search_latency,
+            cdn_bytes_per_second=args.cdn_rate
+        ) as providers:
+            if args.suite in ("stages", "all"):
+                results += bench_stages(
+                    providers, work_dir, args.clips, args.iterations)
+            if args.suite in ("pipeline", "all"):
+                results += bench_pipeline(
+                    providers,
+                    [name for name in args.scripts.split(",") if name],
+                    args.clips,
+                    args.concurrency,
+                    args.iterations,
+                    real_tts=args.real_tts,
+                    real_asr=args.real_asr,
+                    keep_outputs=args.keep_outputs
+                )
+            provider_requests = dict(providers.requests)
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    report = json.dumps({
+        "environment": _environment(),
+        "config": {
+            "suite": args.suite,
+            "iterations": args.iterations,
+            "search_latency": args.search_latency,
+            "cdn_rate": args.cdn_rate,
+            "real_tts": args.real_tts,
+            "real_asr": args.real_asr,
+        },
+        "provider_requests": provider_requests,
+        "results": results,
+    }, indent=2)
+
+    if args.output:
+        args.output.write_text(report)
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
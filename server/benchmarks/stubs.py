@@ -0,0 +1,71 @@
+import re
+from pathlib import Path
+from typing import Callable, List
+import ffmpeg
+import pysubs2
+
+# Roughly the pace of the Indonesian TTS voice
+WORDS_PER_SECOND = 2.5
+WORDS_PER_LINE = 7
+
+KEYWORDS = ["lush green rice paddies", "serene countryside landscape",
+            "peaceful village life", "busy city street", "calm ocean waves"]
+
+
+def script_duration(text: str) -> float:
+    return max(1.0, len(text.split()) / WORDS_PER_SECOND)
+
+
+def stub_keywords(text: str, max_keywords: int = 3, **_) -> List[str]:
+    return KEYWORDS[:max_keywords]
+
+
+def stub_voiceover(text: str, output_dir: str) -> tuple[str, float]:
+    output_path = Path(output_dir) / "voiceover.wav"
+    duration = script_duration(text)
+    (
+        ffmpeg
+        .input(f"sine=frequency=220:duration={duration}", f="lavfi")
+        .output(str(output_path), ar=22050, ac=1)
+        .global_args("-loglevel", "error")
+        .overwrite_output()
+        .run()
+    )
+    return str(output_path), duration
+
+
+def stub_subtitle(voiceover_path: str, text: str, output_dir: str) -> str:
+    # Spread the words evenly over the voiceover, one line per chunk
+    output_path = Path(output_dir) / "subtitle.srt"
+    words = re.findall(r"\S+", text)
+    seconds_per_word = script_duration(text) / max(1, len(words))
+
+    subs = pysubs2.SSAFile()
+    for i in range(0, len(words), WORDS_PER_LINE):
+        chunk = words[i:i + WORDS_PER_LINE]
+        subs.append(pysubs2.SSAEvent(
+            start=int(i * seconds_per_word * 1000),
+            end=int((i + len(chunk)) * seconds_per_word * 1000),
+            text=" ".join(chunk)))
+    subs.save(str(output_path))
+    return str(output_path)
+
+
+def install(module, tts: bool = True, asr: bool = True) -> Callable[[], None]:
+    # Swaps the pipeline's backends on `module` (app.main) and returns a
+    # function that puts the originals back
+    replacements = {"extract_keywords": stub_keywords}
+    if tts:
+        replacements["generate_voiceover"] = stub_voiceover
+    if asr:
+        replacements["generate_subtitle"] = stub_subtitle
+
+    originals = {name: getattr(module, name) for name in replacements}
+    for name, replacement in replacements.items():
+        setattr(module, name, replacement)
+
+    def restore():
+        for name, original in originals.items():
+            setattr(module, name, original)
+
+    return restore
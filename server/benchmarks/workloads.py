@@ -0,0 +1,34 @@
+SCRIPTS = {
+    # ~10 seconds of narration
+    "short": (
+        "Hamparan sawah hijau membentang luas di kaki gunung. "
+        "Para petani bekerja sejak pagi di desa yang tenang."
+    ),
+    # ~60 seconds of narration
+    "long": " ".join([
+        "Hamparan sawah hijau membentang luas di kaki gunung.",
+        "Para petani bekerja sejak pagi di desa yang tenang.",
+        "Air sungai mengalir jernih melewati kebun dan ladang.",
+        "Anak-anak berlari di pematang sambil tertawa riang.",
+        "Di kejauhan, kabut tipis menyelimuti puncak gunung.",
+        "Burung-burung terbang rendah mencari makan di sawah.",
+        "Matahari perlahan naik dan menghangatkan seluruh lembah.",
+        "Pasar desa mulai ramai oleh pedagang sayur dan buah.",
+        "Perahu nelayan kembali ke pantai membawa hasil tangkapan.",
+        "Ombak kecil memecah di pasir putih yang lembut.",
+        "Sore hari langit berubah jingga di atas laut.",
+        "Lampu-lampu kota menyala satu per satu saat malam tiba.",
+        "Jalanan dipenuhi kendaraan yang pulang dari tempat kerja.",
+        "Di hutan, suara serangga mengiringi datangnya malam.",
+        "Kehidupan di desa dan kota berjalan dengan iramanya sendiri.",
+        "Semua keindahan ini menjadi bagian dari negeri kita.",
+        "Mari kita jaga alam agar tetap lestari untuk generasi mendatang.",
+    ]),
+}
+
+CLIP_COUNTS = [1, 5, 20]
+CONCURRENCY = [1, 4, 16]
+ITERATIONS = 3
+
+# Aspect ratios rendered by the render_formats stage benchmark
+ASPECT_RATIOS = ["16:9", "9:16"]